@@ -0,0 +1,122 @@
+"""
+Embedding cache for cable text processing.
+
+This module provides a content-addressed SQLite store so chunks whose text
+has already been embedded with a given model are not sent through the
+model again.
+"""
+
+import hashlib
+import os
+import sqlite3
+import numpy as np
+from typing import List, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "mapper", "embeddings.sqlite3"
+)
+
+# SQLite's default limit on bound parameters is 999; stay well under it.
+MAX_LOOKUP_KEYS = 500
+
+
+def hash_text(text: str) -> bytes:
+    """
+    Hash chunk text into a compact cache key.
+
+    Args:
+        text: The text to hash
+
+    Returns:
+        A 16-byte BLAKE2b digest of the UTF-8 encoded text
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """Disk cache of embeddings keyed by model name and text hash."""
+
+    def __init__(self, model_name: str, path: Optional[str] = None) -> None:
+        """
+        Open (or create) the embedding cache.
+
+        Args:
+            model_name: Name of the model whose embeddings are cached
+            path: Path to the SQLite database file (default: DEFAULT_CACHE_PATH)
+        """
+        path = path or DEFAULT_CACHE_PATH
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.model_name = model_name
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, hash)
+            ) WITHOUT ROWID
+            """
+        )
+        self.conn.commit()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Look up cached embeddings for several texts.
+
+        Args:
+            texts: List of texts to look up
+
+        Returns:
+            List with the cached embedding for each text, or None on a miss
+        """
+        keys = [hash_text(text) for text in texts]
+        found = {}
+
+        for i in range(0, len(keys), MAX_LOOKUP_KEYS):
+            batch = keys[i : i + MAX_LOOKUP_KEYS]
+            placeholders = ", ".join("?" for _ in batch)
+            rows = self.conn.execute(
+                f"SELECT hash, vector FROM embeddings "
+                f"WHERE model = ? AND hash IN ({placeholders})",
+                [self.model_name, *batch],
+            )
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+
+        return [found.get(key) for key in keys]
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]) -> None:
+        """
+        Store embeddings for several texts.
+
+        Args:
+            texts: List of texts that were embedded
+            embeddings: Embedding for each text, in the same order
+        """
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+            [
+                (
+                    self.model_name,
+                    hash_text(text),
+                    np.asarray(embedding, dtype=np.float32).tobytes(),
+                )
+                for text, embedding in zip(texts, embeddings)
+            ],
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        self.conn.close()
+
+    def __enter__(self) -> "EmbeddingCache":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
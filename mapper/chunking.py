@@ -5,10 +5,14 @@ This module provides functionality to split cables into chunks
 for efficient processing and embedding generation.
 """
 
+import functools
 import spacy
-from typing import List, Dict, Any, Optional
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
 from pydantic import BaseModel
 
+if TYPE_CHECKING:
+    from transformers import PreTrainedTokenizerBase
+
 MAX_TEXT_LEN = 10**6
 
 
@@ -23,6 +27,7 @@ class CableChunk(BaseModel):
     date: Optional[str] = None
     source: Optional[str] = None
     classification: Optional[str] = None
+    input_ids: Optional[List[int]] = None
 
 
 class Phrase(BaseModel):
@@ -67,6 +72,20 @@ class PhrasalChunk(BaseModel):
         return self.phrases[-1].end_char
 
 
+@functools.lru_cache(maxsize=None)
+def load_nlp(model: str = "en_core_web_sm") -> "spacy.language.Language":
+    """
+    Load a spaCy pipeline once per process.
+
+    Args:
+        model: The spaCy model to load
+
+    Returns:
+        The loaded spaCy pipeline
+    """
+    return spacy.load(model)
+
+
 def get_phrases(text: str, model: str = "en_core_web_sm") -> List[Phrase]:
     """
     Split text into phrases (sentences with surrounding whitespace).
@@ -78,7 +97,7 @@ def get_phrases(text: str, model: str = "en_core_web_sm") -> List[Phrase]:
     Returns:
         List of Phrase objects containing (phrase_text, start_char, end_char)
     """
-    nlp = spacy.load(model)
+    nlp = load_nlp(model)
     sentences = []
     offset = 0
     original_text = text
@@ -216,15 +235,24 @@ def chunk_cable(
     content: str,
     chunk_size: int = 1000,
     metadata: Optional[Dict[str, Any]] = None,
+    tokenizer: Optional["PreTrainedTokenizerBase"] = None,
 ) -> List[CableChunk]:
     """
     Split a cable into chunks for embedding generation.
 
+    If a tokenizer is given, each chunk is also given the token IDs of its
+    text, so the embedding model doesn't need to tokenize it again. Chunks
+    are tokenized on their own rather than sliced out of the whole cable's
+    tokens: byte-level BPE and Metaspace tokenizers attach the space before
+    a word to the word's token, so slicing would not give the IDs the model
+    gets from the chunk text.
+
     Args:
         cable_id: The ID of the cable
         content: The text content of the cable
         chunk_size: Target size for each chunk in characters
         metadata: Additional metadata to include with each chunk
+        tokenizer: Tokenizer of the embedding model
 
     Returns:
         List of CableChunk objects
@@ -235,6 +263,14 @@ def chunk_cable(
     # Group phrases into chunks
     phrasal_chunks = chunk_phrases(phrases, chunk_size)
     
+    if tokenizer is not None and phrasal_chunks:
+        # One batch call, so a fast tokenizer encodes the chunks in parallel
+        token_ids = tokenizer(
+            [chunk.text for chunk in phrasal_chunks],
+            add_special_tokens=False,
+            verbose=False,
+        )["input_ids"]
+    
     # Create CableChunk objects
     cable_chunks = []
     for i, chunk in enumerate(phrasal_chunks):
@@ -246,6 +282,9 @@ def chunk_cable(
             end_char=chunk.end_char,
         )
         
+        if tokenizer is not None:
+            cable_chunk.input_ids = token_ids[i]
+        
         # Add metadata if provided
         if metadata:
             if "date" in metadata:
@@ -4,17 +4,134 @@ CLI tool for working with diplomatic cables data using DataFusion.
 """
 
 import argparse
+import functools
 import os
 import sys
-from typing import List, Optional
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
 
-from rich.console import Console
+from mapper.server import DEFAULT_SOCKET_PATH, forward, serve
 
-from mapper.context import CablesContext
-from mapper.embeddings import EmbeddingModel
-from mapper.visualization import load_embeddings, create_tsne_plot
+if TYPE_CHECKING:
+    import pandas as pd
+    from rich.console import Console
 
-console = Console()
+    from mapper.chunking import CableChunk
+    from mapper.context import CablesContext
+    from mapper.embeddings import EmbeddingModel
+
+# Heavy dependencies (rich, DataFusion, torch, matplotlib) are imported inside
+# the branches that use them, so --help and argument errors return quickly.
+@functools.lru_cache(maxsize=2)
+def _console(stderr: bool = False) -> "Console":
+    """
+    Create the shared rich console on first use.
+    
+    Args:
+        stderr: Whether to get the console writing to stderr instead of stdout
+        
+    Returns:
+        The shared console for the stream
+    """
+    from rich.console import Console
+    
+    return Console(stderr=stderr)
+
+
+# Estimated rendered size above which results are streamed as CSV instead.
+LARGE_RESULT_CHARS = 100_000
+
+# When embedding on CPU, chunking gets one worker per this many cores.
+CPU_CHUNKING_SHARE = 4
+
+
+def print_result(result: "pd.DataFrame") -> bool:
+    """
+    Print query results to stdout.
+    
+    Small results go through rich with markup and highlighting disabled, so
+    brackets in cable text are not parsed as styles. Large results are
+    streamed as CSV, which avoids rich building styled segments for every
+    cell.
+    
+    Args:
+        result: DataFrame containing the query results
+        
+    Returns:
+        True if the results were streamed as CSV, in which case nothing
+        else should be written to stdout, so the output can be parsed
+    """
+    estimated_chars = len(result) * sum(len(str(value)) for value in result.iloc[0])
+    
+    if estimated_chars > LARGE_RESULT_CHARS:
+        result.to_csv(sys.stdout, index=False)
+        return True
+    
+    _console().print(result, markup=False, highlight=False)
+    return False
+
+
+def flatten_chunks(cables: Iterator[List["CableChunk"]]) -> Iterator["CableChunk"]:
+    """
+    Flatten a stream of per-cable chunk lists into a stream of chunks.
+    
+    Unlike itertools.chain, closing the result closes cables too, so a
+    generator such as iter_cable_chunks shuts down its process pool as soon
+    as the consumer stops.
+    
+    Args:
+        cables: Iterator over the list of chunks for each cable
+        
+    Returns:
+        Iterator over the chunks
+    """
+    try:
+        for chunks in cables:
+            yield from chunks
+    finally:
+        cables.close()
+
+
+class Session:
+    """Contexts and models loaded while running commands, kept for reuse."""
+    
+    def __init__(self) -> None:
+        self._contexts: Dict[str, "CablesContext"] = {}
+        self._models: Dict[Tuple[str, Optional[str]], "EmbeddingModel"] = {}
+    
+    def context(self, csv_file: str) -> "CablesContext":
+        """
+        Get the context for a CSV file, creating it on first use.
+        
+        Args:
+            csv_file: Path to the CSV file containing cables data
+            
+        Returns:
+            CablesContext with the file registered
+        """
+        from mapper.context import CablesContext
+        
+        key = os.path.abspath(csv_file)
+        if key not in self._contexts:
+            self._contexts[key] = CablesContext(key)
+        return self._contexts[key]
+    
+    def model(self, model_name: str, backend: Optional[str] = None) -> "EmbeddingModel":
+        """
+        Get the embedding model with the given name, loading it on first use.
+        
+        Args:
+            model_name: Name of the model to use for embeddings
+            backend: Inference backend (default: chosen from the hardware)
+            
+        Returns:
+            The loaded EmbeddingModel
+        """
+        from mapper.embeddings import EmbeddingModel
+        
+        key = (model_name, backend)
+        if key not in self._models:
+            self._models[key] = EmbeddingModel(model_name=model_name, backend=backend)
+        return self._models[key]
 
 
 def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
@@ -40,6 +157,13 @@ def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
         help="Text to search for in cable content"
     )
     
+    query_group.add_argument(
+        "--search-multi",
+        nargs="+",
+        metavar="TERM",
+        help="Search for cables containing any of these terms"
+    )
+    
     query_group.add_argument(
         "--date-from",
         help="Start date in format MM/DD/YYYY"
@@ -83,15 +207,57 @@ def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
     
     embedding_group.add_argument(
         "--model",
-        default="Alibaba-NLP/gte-Qwen2-7B-instruct",
-        help="Model to use for embeddings (default: Alibaba-NLP/gte-Qwen2-7B-instruct)"
+        default="BAAI/bge-small-en-v1.5",
+        help="Model to use for embeddings (default: BAAI/bge-small-en-v1.5)"
+    )
+    
+    embedding_group.add_argument(
+        "--fast-embeddings",
+        action="store_true",
+        help="Embed with the static Model2Vec model minishlab/potion-base-8M, "
+             "which is much faster but less accurate (overrides --model and --backend)"
     )
     
     embedding_group.add_argument(
-        "--batch-size",
+        "--backend",
+        choices=["torch", "onnx", "openvino"],
+        help="Inference backend for embeddings; onnx and openvino run an "
+             "int8-quantized model (default: torch on GPU, otherwise openvino "
+             "or onnx if installed)"
+    )
+    
+    embedding_group.add_argument(
+        "--max-batch-chunks",
+        type=int,
+        default=16,
+        help="Maximum number of chunks per embedding batch (default: 16)"
+    )
+    
+    embedding_group.add_argument(
+        "--max-batch-chars",
         type=int,
-        default=8,
-        help="Batch size for embedding generation (default: 8)"
+        default=16000,
+        help="Maximum total characters per embedding batch, or 0 to batch "
+             "by --max-batch-chunks alone (default: 16000)"
+    )
+    
+    embedding_group.add_argument(
+        "--embeddings-dtype",
+        choices=["int8", "float16"],
+        default="int8",
+        help="Dtype to store embeddings as; float16 is more precise but twice "
+             "the size (default: int8)"
+    )
+    
+    embedding_group.add_argument(
+        "--cache-path",
+        help="Path to the embedding cache database (default: ~/.cache/mapper/embeddings.sqlite3)"
+    )
+    
+    embedding_group.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Recompute all embeddings without reading or writing the cache"
     )
     
     # Visualization options
@@ -104,7 +270,7 @@ def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
     
     viz_group.add_argument(
         "--embeddings-file",
-        help="Path to the embeddings pickle file for visualization"
+        help="Path to the embeddings .safetensors file for visualization"
     )
     
     viz_group.add_argument(
@@ -121,11 +287,18 @@ def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
         help="Number of iterations for t-SNE (default: 1000)"
     )
     
+    viz_group.add_argument(
+        "--no-pca",
+        action="store_true",
+        help="Run t-SNE on the full embeddings instead of reducing them to 50 "
+             "dimensions with PCA first"
+    )
+    
     # Output options
     output_group = parser.add_argument_group("Output Options")
     output_group.add_argument(
         "--output", "-o",
-        help="Output file path. For embeddings, this will be a pickle file. For visualization, this will be a PNG file."
+        help="Output file path. For embeddings, this will be a .safetensors file with a .meta.parquet sidecar. For visualization, this will be a PNG file."
     )
     
     output_group.add_argument(
@@ -135,68 +308,195 @@ def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
         help="Limit the number of results for queries (default: 100)"
     )
     
+    # Daemon options
+    daemon_group = parser.add_argument_group("Daemon Options")
+    daemon_group.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET_PATH,
+        help=f"Socket of a running 'cables-cli serve' daemon (default: {DEFAULT_SOCKET_PATH})"
+    )
+    
+    daemon_group.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Run in this process even if a daemon is running (--visualize "
+             "without --output always does)"
+    )
+    
+    return parser.parse_args(args)
+
+
+def parse_serve_args(args: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments for the serve subcommand."""
+    parser = argparse.ArgumentParser(
+        prog="cables-cli serve",
+        description="Run a daemon that keeps cables data and embedding models loaded between commands"
+    )
+    
+    parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET_PATH,
+        help=f"Path of the Unix socket to listen on (default: {DEFAULT_SOCKET_PATH})"
+    )
+    
     return parser.parse_args(args)
 
 
 def main(args: Optional[List[str]] = None) -> int:
     """Main entry point for the CLI."""
+    if args is None:
+        args = sys.argv[1:]
+    
+    if args and args[0] == "serve":
+        return serve_main(args[1:])
+    
     parsed_args = parse_args(args)
     
+    # A plot without --output is shown in a window, which has to be on this
+    # process's display rather than the daemon's
+    shows_plot = parsed_args.visualize and not parsed_args.output
+    
+    if not parsed_args.no_daemon and not shows_plot:
+        try:
+            exit_code = forward(args, parsed_args.socket)
+        except RuntimeError as e:
+            _console().print(f"Error: {str(e)}", style="bold red")
+            return 1
+        if exit_code is not None:
+            return exit_code
+    
+    return run(parsed_args, Session())
+
+
+def serve_main(args: List[str]) -> int:
+    """Entry point for the serve subcommand."""
+    from rich.console import Console
+    
+    parsed_args = parse_serve_args(args)
+    session = Session()
+    
+    # The daemon's own messages go to its terminal. The shared console is
+    # left to be created inside the first command, whose output is captured,
+    # so it doesn't pick up the terminal's colors and send them to clients.
+    console = Console()
+    console.print(f"Serving on {parsed_args.socket}", style="bold green")
+    try:
+        serve(lambda command: run(parse_args(command), session), parsed_args.socket)
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        console.print(f"Error: {str(e)}", style="bold red")
+        return 1
+    
+    return 0
+
+
+def run(parsed_args: argparse.Namespace, session: Session) -> int:
+    """
+    Run a parsed command.
+    
+    Args:
+        parsed_args: Parsed command line arguments
+        session: Session providing contexts and models for the command
+        
+    Returns:
+        Exit code for the command
+    """
     try:
         # Handle visualization if requested
         if parsed_args.visualize:
             if not parsed_args.embeddings_file:
-                console.print("Error: --embeddings-file is required for visualization", style="bold red")
+                _console().print("Error: --embeddings-file is required for visualization", style="bold red")
                 return 1
                 
+            from mapper.visualization import create_tsne_plot, load_embeddings
+            
             # Load embeddings
-            df = load_embeddings(parsed_args.embeddings_file)
+            embeddings = load_embeddings(parsed_args.embeddings_file)
             
             # Create t-SNE plot
             create_tsne_plot(
-                df=df,
+                embeddings=embeddings,
                 output_path=parsed_args.output,
                 perplexity=parsed_args.perplexity,
                 n_iter=parsed_args.iterations,
-                title="t-SNE Visualization of Cable Embeddings"
+                title="t-SNE Visualization of Cable Embeddings",
+                reduce_dims=not parsed_args.no_pca
             )
             
             return 0
         
         # Check if the CSV file exists for other operations
         if not os.path.exists(parsed_args.csv_file):
-            console.print(f"Error: CSV file '{parsed_args.csv_file}' not found", style="bold red")
+            _console().print(f"Error: CSV file '{parsed_args.csv_file}' not found", style="bold red")
             return 1
             
         # Initialize the context with the CSV file
-        context = CablesContext(parsed_args.csv_file)
+        context = session.context(parsed_args.csv_file)
         
         # Handle chunking and embedding if requested
         if parsed_args.chunk or parsed_args.embed:
-            # Chunk the cables
-            chunks = context.chunk_all_cables(chunk_size=parsed_args.chunk_size)
-            
-            if parsed_args.embed:
+            if not parsed_args.embed:
+                # Chunk the cables
+                context.chunk_all_cables(chunk_size=parsed_args.chunk_size)
+            else:
+                from mapper.cache import EmbeddingCache
+                
                 # Initialize the embedding model
-                model = EmbeddingModel(model_name=parsed_args.model)
+                if parsed_args.fast_embeddings:
+                    from mapper.embeddings import FAST_MODEL
+                    
+                    model = session.model(FAST_MODEL, "model2vec")
+                else:
+                    model = session.model(parsed_args.model, parsed_args.backend)
+                
+                # CPU inference with torch, ONNX Runtime or OpenVINO already
+                # runs a thread per core, so chunk with a share of them rather
+                # than competing for every core. Model2Vec inference is cheap
+                # enough that chunking is the bottleneck, so it gets them all.
+                max_workers = None
+                if not model.on_gpu and model.backend != "model2vec":
+                    max_workers = max(1, (os.cpu_count() or 1) // CPU_CHUNKING_SHARE)
                 
-                # Generate embeddings
-                embeddings = model.generate_embeddings_for_chunks(
-                    chunks=chunks,
-                    batch_size=parsed_args.batch_size
+                # Chunk the cables lazily so chunking overlaps with inference,
+                # tokenizing each cable once while it is being chunked
+                chunks = flatten_chunks(
+                    context.iter_cable_chunks(
+                        chunk_size=parsed_args.chunk_size,
+                        max_workers=max_workers,
+                        tokenizer=model.tokenizer
+                    )
                 )
                 
+                # Generate embeddings, reusing any cached from earlier runs
+                cache = None
+                if not parsed_args.no_cache:
+                    cache = EmbeddingCache(model.cache_name, parsed_args.cache_path)
+                
+                try:
+                    embeddings = model.generate_embeddings_for_chunks(
+                        chunks=chunks,
+                        max_batch_chunks=parsed_args.max_batch_chunks,
+                        max_batch_chars=parsed_args.max_batch_chars or None,
+                        cache=cache
+                    )
+                finally:
+                    if cache is not None:
+                        cache.close()
+                
                 # Save embeddings if output path is provided
                 if parsed_args.output:
-                    model.save_embeddings(embeddings, parsed_args.output)
+                    model.save_embeddings(
+                        embeddings, parsed_args.output, dtype=parsed_args.embeddings_dtype
+                    )
                 else:
-                    console.print("Warning: No output path provided for embeddings", style="bold yellow")
+                    _console().print("Warning: No output path provided for embeddings", style="bold yellow")
             
             return 0
         
         # Execute a custom query if provided
         if parsed_args.query:
-            result = context.execute_query(parsed_args.query)
+            result = context.execute_query(parsed_args.query, limit=parsed_args.limit)
         else:
             # Otherwise, use the search_cables method with the provided filters
             result = context.search_cables(
@@ -204,29 +504,27 @@ def main(args: Optional[List[str]] = None) -> int:
                 date_from=parsed_args.date_from,
                 date_to=parsed_args.date_to,
                 classification=parsed_args.classification,
-                source=parsed_args.source
+                source=parsed_args.source,
+                limit=parsed_args.limit,
+                terms=parsed_args.search_multi
             )
-            
-            # Apply limit
-            if parsed_args.limit and len(result) > parsed_args.limit:
-                result = result.head(parsed_args.limit)
         
         # Output the results
         if parsed_args.output:
             result.to_csv(parsed_args.output, index=False)
-            console.print(f"Results saved to {parsed_args.output}", style="bold green")
+            _console().print(f"Results saved to {parsed_args.output}", style="bold green")
         else:
             # Print to stdout
             if len(result) > 0:
-                console.print(result)
-                console.print(f"\nTotal results: {len(result)}", style="bold green")
+                streamed = print_result(result)
+                _console(stderr=streamed).print(f"\nTotal results: {len(result)}", style="bold green")
             else:
-                console.print("No results found.", style="bold yellow")
+                _console().print("No results found.", style="bold yellow")
                 
         return 0
         
     except Exception as e:
-        console.print(f"Error: {str(e)}", style="bold red")
+        _console().print(f"Error: {str(e)}", style="bold red")
         return 1
 
 
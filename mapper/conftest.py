@@ -0,0 +1,86 @@
+"""
+Shared fixtures for the mapper tests.
+"""
+
+from typing import Callable
+
+import pytest
+from tokenizers import (
+    Tokenizer,
+    decoders,
+    models,
+    normalizers,
+    pre_tokenizers,
+    processors,
+    trainers,
+)
+from transformers import PreTrainedTokenizerFast
+
+WORDS = (
+    "[PAD] [UNK] [CLS] [SEP] <eos> unclassified buenos aires 2481 . subject : "
+    "visit of the minister embassy talks"
+).split()
+
+# Post-processors adding special tokens the way real models do.
+POST_PROCESSORS = {
+    # BERT-style classification and separator tokens
+    "cls-sep": processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", 2), ("[SEP]", 3)]
+    ),
+    # A trailing end-of-text token, as gte-Qwen2 appends for last-token pooling
+    "eos": processors.TemplateProcessing(single="$A <eos>", special_tokens=[("<eos>", 4)]),
+}
+
+
+# Text the byte-level BPE tokenizer is trained on.
+BPE_CORPUS = [
+    "Embassy talks. Subject: visit of the minister. Buenos Aires 2481.",
+    "The minister will visit the embassy. Subject: talks in Buenos Aires.",
+]
+
+
+def byte_level_tokenizer() -> Tokenizer:
+    """
+    Train a small byte-level BPE tokenizer, as used by GPT-2 and gte-Qwen2.
+
+    Like theirs, it attaches the space before a word to the word's token.
+    """
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=400,
+        special_tokens=WORDS[:5],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    tokenizer.train_from_iterator(BPE_CORPUS, trainer)
+    return tokenizer
+
+
+@pytest.fixture
+def make_tokenizer() -> Callable[..., PreTrainedTokenizerFast]:
+    """
+    Build small fast tokenizers without downloading a model.
+
+    Tokenizers are word-level, or byte-level BPE with byte_level=True.
+    Special tokens come only from the tokenizer's post-processor, named by a
+    key of POST_PROCESSORS.
+    """
+
+    def make(post_processor: str, byte_level: bool = False) -> PreTrainedTokenizerFast:
+        if byte_level:
+            tokenizer = byte_level_tokenizer()
+        else:
+            tokenizer = Tokenizer(
+                models.WordLevel(
+                    {word: i for i, word in enumerate(WORDS)}, unk_token="[UNK]"
+                )
+            )
+            tokenizer.normalizer = normalizers.Lowercase()
+            tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+        tokenizer.post_processor = POST_PROCESSORS[post_processor]
+        return PreTrainedTokenizerFast(
+            tokenizer_object=tokenizer, pad_token="[PAD]", unk_token="[UNK]"
+        )
+
+    return make
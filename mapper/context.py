@@ -1,13 +1,136 @@
-from datafusion import SessionContext, ColumnType, Column
-from datafusion.expr import lit, col
+from datafusion import Expr, SessionContext, col, lit, udf
+from datafusion import functions as f
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import datetime
+import itertools
+import multiprocessing
 import os
-from typing import List, Dict, Any, Optional
+import re
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import TYPE_CHECKING, Iterator, List, Dict, Any, Optional, Tuple
 from rich.console import Console
 
 from mapper.chunking import chunk_cable, CableChunk
 
-console = Console()
+if TYPE_CHECKING:
+    from transformers import PreTrainedTokenizerBase
+
+# Status messages go to stderr, keeping stdout for query results.
+console = Console(stderr=True)
+
+# File extensions DataFusion's CSV reader can decompress while streaming.
+COMPRESSION_EXTENSIONS = {
+    ".gz": "gzip",
+    ".bz2": "bzip2",
+    ".xz": "xz",
+    ".zst": "zstd",
+}
+
+# Number of cables sent to a chunking worker per task.
+CHUNK_TASK_SIZE = 64
+
+# Low-cardinality columns exposed dictionary-encoded through the cables_dict view.
+DICTIONARY_COLUMNS = ("source", "classification")
+
+# Formats tried, in order, when parsing the date column of the CSV. Most
+# rows look like "12/28/1966 18:48", but some dumps carry seconds or only
+# the date.
+CABLE_DATE_FORMATS = ("%m/%d/%Y %H:%M", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y")
+
+# Format accepted for date filters in search_cables.
+SEARCH_DATE_FORMAT = "%m/%d/%Y"
+
+
+def _parse_search_date(value: str) -> datetime.datetime:
+    """
+    Parse a date filter given in MM/DD/YYYY format.
+    
+    Args:
+        value: The date to parse
+        
+    Returns:
+        The date at midnight
+        
+    Raises:
+        ValueError: If value is not in MM/DD/YYYY format.
+    """
+    try:
+        return datetime.datetime.strptime(value, SEARCH_DATE_FORMAT)
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected MM/DD/YYYY") from None
+
+
+def _parse_cable_dates(dates: pa.Array) -> pa.Array:
+    """
+    Parse cable dates, trying each of CABLE_DATE_FORMATS in turn.
+    
+    DataFusion's to_timestamp fails the whole query on the first value it
+    can't parse, so this runs as a UDF instead: a date matching none of the
+    formats becomes null, and one bad row doesn't break every search.
+    
+    Args:
+        dates: Date strings as they appear in the CSV
+        
+    Returns:
+        Timestamps in seconds, null where no format matched
+    """
+    return pc.coalesce(*(
+        pc.strptime(dates, format=fmt, unit="s", error_is_null=True)
+        for fmt in CABLE_DATE_FORMATS
+    ))
+
+
+parse_cable_date = udf(
+    _parse_cable_dates, [pa.string()], pa.timestamp("s"), "immutable", "parse_cable_date"
+)
+
+
+def _timestamp_lit(value: datetime.datetime) -> Expr:
+    """Build a literal matching the type of the parsed ts column."""
+    return lit(pa.scalar(value, type=pa.timestamp("s")))
+
+
+# Tokenizer used by _chunk_one in worker processes; set by _init_chunk_worker.
+_worker_tokenizer: Optional["PreTrainedTokenizerBase"] = None
+
+
+def _init_chunk_worker(tokenizer: Optional["PreTrainedTokenizerBase"]) -> None:
+    """
+    Store the tokenizer once per worker process rather than once per task.
+    
+    Args:
+        tokenizer: Tokenizer to attach token IDs with, or None
+    """
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _chunk_cables(
+    cables: List[Tuple[str, str]], chunk_size: int
+) -> List[List[CableChunk]]:
+    """
+    Chunk a group of cables. Top-level so it can be dispatched to worker processes.
+    
+    Args:
+        cables: List of (cable_id, content) tuples
+        chunk_size: Target size for each chunk in characters
+        
+    Returns:
+        List of CableChunk objects without metadata for each cable
+    """
+    return [
+        chunk_cable(
+            cable_id=cable_id,
+            content=content,
+            chunk_size=chunk_size,
+            tokenizer=_worker_tokenizer
+        )
+        for cable_id, content in cables
+    ]
+
 
 class CablesContext:
     """Context for working with diplomatic cables data using DataFusion."""
@@ -21,20 +144,20 @@ class CablesContext:
                        If None, no data will be loaded initially.
         """
         self.ctx = SessionContext()
+        self.ctx.register_udf(parse_cable_date)
         self.data_path = data_path
-        self.cables_df = None
         
         # Define the schema for cables
-        self.schema = {
-            "id": ColumnType.Utf8,
-            "date": ColumnType.Utf8,
-            "reference_number": ColumnType.Utf8,
-            "source": ColumnType.Utf8,
-            "classification": ColumnType.Utf8,
-            "references": ColumnType.Utf8,
-            "header": ColumnType.Utf8,
-            "content": ColumnType.Utf8
-        }
+        self.schema = pa.schema([
+            pa.field("id", pa.string()),
+            pa.field("date", pa.string()),
+            pa.field("reference_number", pa.string()),
+            pa.field("source", pa.string()),
+            pa.field("classification", pa.string()),
+            pa.field("references", pa.string()),
+            pa.field("header", pa.string()),
+            pa.field("content", pa.string()),
+        ])
         
         if data_path and os.path.exists(data_path):
             self.load_data(data_path)
@@ -43,86 +166,164 @@ class CablesContext:
         """
         Load cables data from a CSV file.
         
+        The file is registered as a DataFusion CSV table rather than read up
+        front, so parsing happens lazily in DataFusion's native reader and
+        only the columns and rows a query needs are materialized.
+        
+        Files ending in .gz, .bz2, .xz or .zst are decompressed as they are
+        streamed, which cuts the bytes read from disk for large dumps.
+        
         Args:
             path: Path to the CSV file containing cables data.
+            
+        Raises:
+            ValueError: If the file does not have one column per schema field.
         """
         self.data_path = path
+        compression = COMPRESSION_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        compression_option = (
+            f"'format.compression' '{compression}'," if compression else ""
+        )
         
-        # Read the CSV file using pandas
-        df = pd.read_csv(path, header=None)
+        # register_csv has no escape option, and cable bodies contain both
+        # backslash-escaped quotes and embedded newlines, so declare the table
+        # with DDL instead.
+        columns = ", ".join(f'"{field.name}" VARCHAR' for field in self.schema)
+        location = path.replace("'", "''")
+        options = f"""
+        STORED AS CSV
+        LOCATION '{location}'
+        OPTIONS (
+            {compression_option}
+            'format.has_header' 'false',
+            'format.escape' '\\',
+            'format.newlines_in_values' 'true',
+            'format.schema_infer_max_rec' '1'
+        )
+        """
         
-        # Rename columns to match our schema
-        if len(df.columns) >= 8:
-            df.columns = ["id", "date", "reference_number", "source", 
-                          "classification", "references", "header", "content"]
-            
-            # Store the dataframe
-            self.cables_df = df
-            
-            # Register the dataframe with DataFusion
-            self.ctx.register_dataframe("cables", df)
-            console.print(f"Loaded {len(df)} cables from {path}", style="bold green")
-        else:
-            raise ValueError(f"CSV file {path} does not have the expected number of columns")
+        for table in ("cables_dict", "cables", "cables_probe"):
+            if self.ctx.table_exist(table):
+                self.ctx.deregister_table(table)
+        
+        # With a declared schema, a file with the wrong number of columns only
+        # fails once a query reads it, with an opaque error. Infer the column
+        # count from the first record instead and reject the file up front.
+        self.ctx.sql(f"CREATE EXTERNAL TABLE cables_probe {options}")
+        column_count = len(self.ctx.table("cables_probe").schema())
+        self.ctx.deregister_table("cables_probe")
+        if column_count != len(self.schema):
+            raise ValueError(
+                f"CSV file {path} has {column_count} columns, expected {len(self.schema)}"
+            )
+        
+        self.ctx.sql(f"CREATE EXTERNAL TABLE cables ({columns}) {options}")
+        
+        # Searches go through a view with source and classification
+        # dictionary-encoded, so their values are held once per batch and
+        # results carry them as categoricals. The view also parses the date
+        # into a ts timestamp so date filters and ordering compare integers
+        # instead of MM/DD/YYYY strings, which don't sort chronologically.
+        # Dates that can't be parsed are null, so they never match a date
+        # filter and sort last.
+        view_columns = ", ".join(
+            f"arrow_cast(\"{field.name}\", 'Dictionary(Int16, Utf8)') AS \"{field.name}\""
+            if field.name in DICTIONARY_COLUMNS
+            else f'"{field.name}"'
+            for field in self.schema
+        )
+        view_columns += ", parse_cable_date(date) AS ts"
+        self.ctx.sql(f"CREATE VIEW cables_dict AS SELECT {view_columns} FROM cables")
+        console.print(f"Registered cables from {path}", style="bold green")
     
-    def execute_query(self, query: str) -> pd.DataFrame:
+    def execute_query(self, query: str, limit: Optional[int] = None) -> pd.DataFrame:
         """
         Execute a SQL query against the cables data.
         
         Args:
             query: SQL query to execute.
+            limit: Maximum number of rows to return. The limit is added to the
+                   plan, so execution stops once enough rows are produced.
             
         Returns:
             DataFrame containing the query results.
         """
-        return self.ctx.sql(query).collect().to_pandas()
+        df = self.ctx.sql(query)
+        
+        if limit:
+            df = df.limit(limit)
+        
+        return df.to_pandas()
     
     def search_cables(self, 
                      text: Optional[str] = None,
                      date_from: Optional[str] = None,
                      date_to: Optional[str] = None,
                      classification: Optional[str] = None,
-                     source: Optional[str] = None) -> pd.DataFrame:
+                     source: Optional[str] = None,
+                     limit: Optional[int] = None,
+                     terms: Optional[List[str]] = None) -> pd.DataFrame:
         """
         Search cables based on various criteria.
         
+        Filters are built as DataFusion expressions rather than interpolated
+        SQL, so user input is always treated as a literal and the optimizer
+        can push the projection, filters and limit down into the scan.
+        
+        Text matching is case-insensitive. Multiple terms are compiled into a
+        single regex alternation, which DataFusion's regex engine matches in
+        one linear pass over each cable rather than one scan per term.
+        
         Args:
             text: Text to search for in the content.
             date_from: Start date in format MM/DD/YYYY.
             date_to: End date in format MM/DD/YYYY.
             classification: Classification level.
             source: Source of the cable.
+            limit: Maximum number of rows to return. If None, return all matches.
+            terms: Match cables whose content contains any of these terms.
             
         Returns:
             DataFrame containing matching cables.
         """
-        conditions = []
+        df = self.ctx.table("cables_dict")
         
         if text:
-            conditions.append(f"content LIKE '%{text}%'")
+            df = df.filter(f.strpos(f.lower(col("content")), lit(text.lower())) > lit(0))
+        
+        if terms:
+            pattern = "(?i)" + "|".join(re.escape(term) for term in terms)
+            df = df.filter(f.regexp_like(col("content"), lit(pattern)))
         
         if date_from:
-            conditions.append(f"date >= '{date_from}'")
+            df = df.filter(col("ts") >= _timestamp_lit(_parse_search_date(date_from)))
         
         if date_to:
-            conditions.append(f"date <= '{date_to}'")
+            # date_to is inclusive, so keep anything before the following midnight
+            end = _parse_search_date(date_to) + datetime.timedelta(days=1)
+            df = df.filter(col("ts") < _timestamp_lit(end))
         
         if classification:
-            conditions.append(f"classification = '{classification}'")
+            df = df.filter(col("classification") == lit(classification))
         
         if source:
-            conditions.append(f"source LIKE '%{source}%'")
+            df = df.filter(f.strpos(col("source"), lit(source)) > lit(0))
         
-        where_clause = " AND ".join(conditions) if conditions else "1=1"
+        df = df.sort(col("ts").sort(nulls_first=False))
         
-        query = f"""
-        SELECT id, date, reference_number, source, classification, content
-        FROM cables
-        WHERE {where_clause}
-        ORDER BY date
-        """
+        if limit:
+            df = df.limit(limit)
+        
+        df = df.select(
+            col("id"),
+            col("date"),
+            col("reference_number"),
+            col("source"),
+            col("classification"),
+            col("content"),
+        )
         
-        return self.execute_query(query)
+        return df.to_pandas()
     
     def get_cable_by_id(self, cable_id: str) -> pd.DataFrame:
         """
@@ -134,50 +335,128 @@ class CablesContext:
         Returns:
             DataFrame containing the requested cable.
         """
-        query = f"""
-        SELECT *
-        FROM cables
-        WHERE id = '{cable_id}'
+        # Build the plan with the DataFrame API rather than formatting SQL,
+        # so repeated lookups skip the SQL parser and the ID is bound as a
+        # literal instead of being spliced into the query text.
+        return self.ctx.table("cables").filter(col("id") == lit(cable_id)).to_pandas()
+    
+    def iter_cable_chunks(
+        self,
+        chunk_size: int = 1000,
+        max_workers: Optional[int] = None,
+        tokenizer: Optional["PreTrainedTokenizerBase"] = None,
+    ) -> Iterator[List[CableChunk]]:
+        """
+        Chunk all cables, yielding each cable's chunks as soon as it is done.
+        
+        Cables are chunked independently, so the work is spread over a pool
+        of worker processes, CHUNK_TASK_SIZE cables per task. Only a couple
+        of tasks per worker are in flight at once, so cables are read from
+        the table as fast as they are chunked rather than all up front.
+        Workers only receive the ID and content; the date, source and
+        classification are converted a column at a time per record batch,
+        kept with the task they belong to and attached to the chunks back in
+        this process.
+        
+        Args:
+            chunk_size: Target size for each chunk in characters
+            max_workers: Number of worker processes (default: one per CPU)
+            tokenizer: If given, each chunk also carries its token IDs
+            
+        Returns:
+            Iterator over the list of CableChunk objects for each cable
         """
+        if not self.ctx.table_exist("cables"):
+            raise ValueError("No cables data loaded. Call load_data() first.")
         
-        return self.execute_query(query)
+        stream = self.ctx.sql(
+            "SELECT id, content, date, source, classification FROM cables"
+        ).execute_stream()
+        
+        def cable_groups() -> Iterator[Tuple[List[Tuple[str, str]], List[Tuple[str, str, str]]]]:
+            # Each group is (cable_id, content) per cable for the workers, and
+            # (date, source, classification) per cable to attach afterwards
+            for batch in stream:
+                batch = batch.to_pyarrow()
+                ids, contents, dates, sources, classifications = (
+                    column.to_pylist() for column in batch.columns
+                )
+                
+                for start in range(0, len(ids), CHUNK_TASK_SIZE):
+                    end = start + CHUNK_TASK_SIZE
+                    yield (
+                        list(zip(ids[start:end], contents[start:end])),
+                        list(zip(dates[start:end], sources[start:end], classifications[start:end])),
+                    )
+        
+        # Spawn rather than fork: the parent holds DataFusion's runtime threads.
+        mp_context = multiprocessing.get_context("spawn")
+        workers = max_workers or os.cpu_count() or 1
+        
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp_context,
+            initializer=_init_chunk_worker,
+            initargs=(tokenizer,),
+        )
+        try:
+            # Keep only a few groups per worker in flight, topped up as
+            # results are consumed. Submitting everything up front would hold
+            # the whole corpus's text in pending tasks before the first chunk
+            # came back.
+            groups = cable_groups()
+            
+            def submit(
+                cables: List[Tuple[str, str]], metadata: List[Tuple[str, str, str]]
+            ) -> Tuple[Future, List[Tuple[str, str, str]]]:
+                return executor.submit(_chunk_cables, cables, chunk_size), metadata
+            
+            pending = deque(
+                submit(*group) for group in itertools.islice(groups, 2 * workers)
+            )
+            
+            while pending:
+                future, metadata = pending.popleft()
+                results = future.result()
+                group = next(groups, None)
+                if group is not None:
+                    pending.append(submit(*group))
+                
+                for chunks, (date, source, classification) in zip(results, metadata):
+                    for chunk in chunks:
+                        chunk.date = date
+                        chunk.source = source
+                        chunk.classification = classification
+                    
+                    yield chunks
+        finally:
+            # If the caller stops early, don't wait for groups nobody will read
+            executor.shutdown(cancel_futures=True)
     
-    def chunk_all_cables(self, chunk_size: int = 1000) -> List[CableChunk]:
+    def chunk_all_cables(
+        self, chunk_size: int = 1000, max_workers: Optional[int] = None
+    ) -> List[CableChunk]:
         """
         Split all cables into chunks for embedding generation.
         
         Args:
             chunk_size: Target size for each chunk in characters
+            max_workers: Number of worker processes (default: one per CPU)
             
         Returns:
             List of CableChunk objects
         """
-        if self.cables_df is None:
-            raise ValueError("No cables data loaded. Call load_data() first.")
-        
         all_chunks = []
+        cable_count = 0
         
         with console.status("[bold green]Chunking cables...") as status:
-            for _, row in self.cables_df.iterrows():
-                # Extract metadata
-                metadata = {
-                    "date": row["date"],
-                    "source": row["source"],
-                    "classification": row["classification"]
-                }
-                
-                # Chunk the cable
-                chunks = chunk_cable(
-                    cable_id=row["id"],
-                    content=row["content"],
-                    chunk_size=chunk_size,
-                    metadata=metadata
-                )
-                
+            for chunks in self.iter_cable_chunks(chunk_size, max_workers):
                 all_chunks.extend(chunks)
+                cable_count += 1
                 
                 # Update status message
-                status.update(f"[bold green]Chunked cable {row['id']} into {len(chunks)} chunks")
+                if chunks:
+                    status.update(f"[bold green]Chunked cable {chunks[0].cable_id} into {len(chunks)} chunks")
         
-        console.print(f"Created {len(all_chunks)} chunks from {len(self.cables_df)} cables", style="bold green")
+        console.print(f"Created {len(all_chunks)} chunks from {cable_count} cables", style="bold green")
         return all_chunks
@@ -2,128 +2,815 @@
 Embedding utilities for cable text processing.
 
 This module provides functionality to generate embeddings for cable chunks
-using the gte-Qwen2-7B-instruct model.
+using a sentence-transformers model (bge-small-en-v1.5 by default).
 """
 
+import contextlib
+import functools
+import importlib.util
 import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
 import torch
-import pandas as pd
-from typing import List, Dict, Any, Optional, Union
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Sized, Tuple, Union
 from sentence_transformers import SentenceTransformer
+from transformers import PreTrainedTokenizerBase
 from rich.console import Console
 from rich.progress import Progress, TextColumn, BarColumn, TaskProgressColumn, TimeRemainingColumn
 
+from mapper.cache import EmbeddingCache
 from mapper.chunking import CableChunk
+from mapper.storage import save_quantized_embeddings
 
 console = Console()
 
+# Number of packed batches the producer thread may run ahead of the model.
+PIPELINE_DEPTH = 4
+
+# Minimum seconds between progress bar updates while embedding.
+PROGRESS_INTERVAL = 0.25
+
+# Number of texts whose embeddings generate_embedding remembers.
+SINGLE_EMBEDDING_CACHE_SIZE = 1024
+
+# Environment variable overriding the number of threads used for CPU inference.
+THREADS_ENV_VAR = "MAPPER_THREADS"
+
+# Inference backends accepted by EmbeddingModel.
+BACKENDS = ("torch", "onnx", "openvino", "model2vec")
+
+# Static Model2Vec model used for --fast-embeddings.
+FAST_MODEL = "minishlab/potion-base-8M"
+
+# Text tokenized when a model is loaded to find the special tokens its
+# tokenizer adds.
+TOKENIZER_PROBE = "UNCLASSIFIED BUENOS AIRES 2481. Subject: Visit of the Minister."
+
+# Where int8-quantized exports of models are kept between runs, one
+# directory per backend.
+MODEL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mapper")
+
+# Quantized model file written by each backend's export, relative to the model.
+QUANTIZED_FILES = {
+    # Dynamically quantized by export_dynamic_quantized_onnx_model
+    "onnx": "onnx/model_qint8_avx512_vnni.onnx",
+    # Exported with int8 weight compression
+    "openvino": "openvino/openvino_model.xml",
+}
+
+
+def is_installed(name: str) -> bool:
+    """
+    Check whether a module is installed.
+    
+    Args:
+        name: Module name, which may be dotted
+        
+    Returns:
+        True if the module can be imported
+    """
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        # find_spec imports a dotted name's parent, which may be missing
+        return False
+
+
+def default_backend() -> str:
+    """
+    Pick the inference backend to use when none is requested.
+    
+    Returns:
+        "torch" when a CUDA device is available. Otherwise "openvino" if
+        OpenVINO and Optimum Intel are installed, then "onnx" if ONNX Runtime
+        and Optimum are, falling back to "torch".
+    """
+    if torch.cuda.is_available():
+        return "torch"
+    if all(is_installed(name) for name in ("openvino", "optimum.intel")):
+        return "openvino"
+    if all(is_installed(name) for name in ("onnxruntime", "optimum")):
+        return "onnx"
+    return "torch"
+
+
+def set_cpu_threads() -> None:
+    """
+    Use every core for CPU inference unless MAPPER_THREADS says otherwise.
+    
+    PyTorch's default intra-op thread count often leaves cores idle on
+    large machines. This should only be called when running on CPU, since
+    extra threads just contend with the GPU's launch thread.
+    """
+    torch.set_num_threads(int(os.environ.get(THREADS_ENV_VAR, os.cpu_count() or 1)))
+    # Inter-op threads can only be set before any parallel work has run, so
+    # a second model loaded in the same process keeps the first setting
+    with contextlib.suppress(RuntimeError):
+        torch.set_num_interop_threads(2)
+
+
+def special_token_affixes(
+    tokenizer: PreTrainedTokenizerBase,
+) -> Optional[Tuple[List[int], List[int]]]:
+    """
+    Find the special tokens a tokenizer adds before and after a text.
+    
+    Tokenizers add them in different places: some in Python, others only in
+    the post-processor of their tokenizer.json, such as the <|endoftext|>
+    gte-Qwen2 appends. Comparing a probe text tokenized with and without
+    special tokens finds them either way.
+    
+    Args:
+        tokenizer: The model's tokenizer
+        
+    Returns:
+        The special token IDs added before and after a text, or None if the
+        tokenizer does more than add tokens around the text, in which case
+        chunks must be embedded from text
+    """
+    ids = tokenizer(TOKENIZER_PROBE, add_special_tokens=False)["input_ids"]
+    full = tokenizer(TOKENIZER_PROBE)["input_ids"]
+    for start in range(len(full) - len(ids) + 1):
+        if full[start : start + len(ids)] == ids:
+            return full[:start], full[start + len(ids) :]
+    return None
+
+
+def load_quantized_model(model_name: str, backend: str) -> SentenceTransformer:
+    """
+    Load an int8-quantized version of a model, exporting it on first use.
+    
+    The model is exported for the backend, quantized to int8 and saved under
+    MODEL_CACHE_DIR, so later runs load the quantized file directly.
+    
+    Args:
+        model_name: Name or path of the model
+        backend: "onnx" or "openvino"
+        
+    Returns:
+        SentenceTransformer running the quantized model on the backend
+    """
+    model_dir = os.path.join(
+        MODEL_CACHE_DIR, backend, model_name.strip("/").replace("/", "--")
+    )
+    
+    if not os.path.exists(os.path.join(model_dir, QUANTIZED_FILES[backend])):
+        console.print(f"Exporting int8 {backend} model to {model_dir}...", style="bold green")
+        if backend == "onnx":
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+            
+            model = SentenceTransformer(model_name, backend="onnx", trust_remote_code=True)
+            model.save(model_dir)
+            export_dynamic_quantized_onnx_model(model, "avx512_vnni", model_dir)
+        else:
+            # Weight compression needs no calibration dataset, unlike
+            # OpenVINO's static quantization
+            model = SentenceTransformer(
+                model_name,
+                backend="openvino",
+                trust_remote_code=True,
+                model_kwargs={"load_in_8bit": True},
+            )
+            model.save(model_dir)
+    
+    return SentenceTransformer(
+        model_dir,
+        backend=backend,
+        trust_remote_code=True,
+        model_kwargs={"file_name": QUANTIZED_FILES[backend]},
+    )
+
+
+def pack_batches(
+    chunks: List[CableChunk], max_batch_chunks: int, max_batch_chars: Optional[int]
+) -> Iterator[List[CableChunk]]:
+    """
+    Greedily pack chunks into batches bounded by count and total characters.
+    
+    A chunk longer than max_batch_chars on its own still gets a batch of one.
+    
+    Args:
+        chunks: List of CableChunk objects, ideally sorted by text length
+        max_batch_chunks: Maximum number of chunks per batch
+        max_batch_chars: Maximum total characters of text per batch, or None
+                         to bound batches by count alone
+        
+    Returns:
+        Iterator over batches of chunks
+    """
+    batch = []
+    batch_chars = 0
+    
+    for chunk in chunks:
+        if batch and (
+            len(batch) >= max_batch_chunks
+            or (
+                max_batch_chars is not None
+                and batch_chars + len(chunk.text) > max_batch_chars
+            )
+        ):
+            yield batch
+            batch = []
+            batch_chars = 0
+        
+        batch.append(chunk)
+        batch_chars += len(chunk.text)
+    
+    if batch:
+        yield batch
+
+
+def dedupe_by_text(chunks: List[CableChunk]) -> Tuple[List[CableChunk], List[int]]:
+    """
+    Drop chunks whose text repeats an earlier chunk's.
+    
+    Cables repeat a lot of boilerplate, and identical text always embeds to
+    the same vector, so it only needs to go through the model once.
+    
+    Args:
+        chunks: List of CableChunk objects
+        
+    Returns:
+        The chunks with distinct text, and for each input chunk the index of
+        the distinct chunk with the same text
+    """
+    positions: Dict[str, int] = {}
+    unique = []
+    index = []
+    
+    for chunk in chunks:
+        if chunk.text not in positions:
+            positions[chunk.text] = len(unique)
+            unique.append(chunk)
+        index.append(positions[chunk.text])
+    
+    return unique, index
+
+
+def sequence_length(chunk: CableChunk) -> int:
+    """
+    Length of a chunk as the model will see it.
+    
+    Padding is per token, so chunks are compared by token count when they
+    have been tokenized, and by characters otherwise.
+    
+    Args:
+        chunk: The chunk to measure
+        
+    Returns:
+        Number of tokens, or of characters if the chunk has no input_ids
+    """
+    if chunk.input_ids is not None:
+        return len(chunk.input_ids)
+    return len(chunk.text)
+
+
+def sorted_batches(
+    chunks: Iterable[CableChunk],
+    max_batch_chunks: int,
+    max_batch_chars: Optional[int],
+    sort_window: int = 1024,
+) -> Iterator[List[CableChunk]]:
+    """
+    Pack a stream of chunks into batches, length-sorting within a window.
+    
+    Chunks are sorted by sequence_length, so batches pad to similar token
+    counts. Sorting a bounded window rather than the whole input lets batches be
+    emitted before the input is exhausted while still keeping padding low.
+    
+    Args:
+        chunks: Iterable of CableChunk objects
+        max_batch_chunks: Maximum number of chunks per batch
+        max_batch_chars: Maximum total characters of text per batch, or None
+        sort_window: Number of chunks to buffer and sort before packing
+        
+    Returns:
+        Iterator over batches of chunks
+    """
+    window = []
+    
+    for chunk in chunks:
+        window.append(chunk)
+        if len(window) >= sort_window:
+            window.sort(key=sequence_length)
+            yield from pack_batches(window, max_batch_chunks, max_batch_chars)
+            window = []
+    
+    if window:
+        window.sort(key=sequence_length)
+        yield from pack_batches(window, max_batch_chunks, max_batch_chars)
+
+
+class ChunkEmbeddings:
+    """
+    Embeddings of chunks in the order they were generated, with their IDs.
+    
+    Vectors are written into one preallocated float32 array rather than kept
+    as a Python list per chunk, which would cost several times the memory.
+    When the number of chunks isn't known up front, the array grows by
+    doubling.
+    """
+    
+    def __init__(self, capacity: Optional[int] = None) -> None:
+        """
+        Create an empty set of embeddings.
+        
+        Args:
+            capacity: Number of chunks expected, if known
+        """
+        self.cable_ids: List[str] = []
+        self.chunk_ids: List[int] = []
+        self._capacity = capacity or 1024
+        self._vectors: Optional[np.ndarray] = None
+    
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+    
+    @property
+    def vectors(self) -> np.ndarray:
+        """Array of shape (N, D) holding the embeddings."""
+        if self._vectors is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._vectors[: len(self)]
+    
+    def extend(self, chunks: List[CableChunk], embeddings: List[List[float]]) -> None:
+        """
+        Add the embeddings of a batch of chunks.
+        
+        Args:
+            chunks: The chunks that were embedded
+            embeddings: Embedding for each chunk, in the same order
+        """
+        batch = np.asarray(embeddings, dtype=np.float32)
+        start, end = len(self), len(self) + len(chunks)
+        
+        if self._vectors is None:
+            self._vectors = np.empty((max(self._capacity, end), batch.shape[1]), dtype=np.float32)
+        elif end > len(self._vectors):
+            grown = np.empty((max(2 * len(self._vectors), end), batch.shape[1]), dtype=np.float32)
+            grown[:start] = self._vectors[:start]
+            self._vectors = grown
+        
+        self._vectors[start:end] = batch
+        self.cable_ids.extend(chunk.cable_id for chunk in chunks)
+        self.chunk_ids.extend(chunk.chunk_id for chunk in chunks)
+
 
 class EmbeddingModel:
     """Wrapper for the embedding model."""
     
-    def __init__(self, model_name: str = "Alibaba-NLP/gte-Qwen2-7B-instruct"):
+    def __init__(
+        self,
+        model_name: str = "BAAI/bge-small-en-v1.5",
+        backend: Optional[str] = None,
+        dtype: Optional[torch.dtype] = None,
+    ) -> None:
         """
         Initialize the embedding model.
         
         Args:
             model_name: Name of the model to use for embeddings
+            backend: Inference backend, one of BACKENDS. "onnx" and
+                     "openvino" run an int8-quantized export of the model on
+                     ONNX Runtime or OpenVINO, which is considerably faster
+                     on CPUs. "model2vec" loads a static Model2Vec model
+                     (such as FAST_MODEL), which embeds by averaging token
+                     vectors: far faster again, at some cost in quality.
+                     Defaults to default_backend().
+            dtype: Weight dtype for the torch backend. Defaults to float16 on
+                   CUDA, which halves the memory traffic of inference, and
+                   float32 on CPU.
         """
-        console.print(f"Initializing embedding model: {model_name}...", style="bold green")
-        self.model = SentenceTransformer(model_name, trust_remote_code=True)
+        backend = backend or default_backend()
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+        
+        console.print(f"Initializing embedding model: {model_name} ({backend})...", style="bold green")
+        if backend in QUANTIZED_FILES:
+            self.model = load_quantized_model(model_name, backend)
+        elif backend == "model2vec":
+            from model2vec import StaticModel
+            
+            self.model = StaticModel.from_pretrained(model_name, force_download=False)
+        else:
+            if dtype is None:
+                dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+            if not torch.cuda.is_available():
+                set_cpu_threads()
+            self.model = SentenceTransformer(
+                model_name,
+                trust_remote_code=True,
+                model_kwargs={"torch_dtype": dtype},
+            )
+            if torch.cuda.is_available():
+                self._compile()
         self.model_name = model_name
+        self.backend = backend
+        self._special_tokens = None
+        if backend != "model2vec":
+            self._special_tokens = special_token_affixes(self.model.tokenizer)
+        self._recent_embeddings: OrderedDict[str, List[float]] = OrderedDict()
         console.print("Model initialized successfully!", style="bold green")
     
+    def _compile(self) -> None:
+        """
+        Compile the underlying transformer with TorchInductor.
+        
+        Compiling fuses kernels, which only pays off on GPU. Length-sorted
+        packing produces batches of many different shapes, so the model is
+        compiled with dynamic shapes rather than with CUDA graphs, which
+        would record a graph for every shape. The warm-up encodes two texts
+        of different lengths, so that neither dimension is specialized to 1
+        and the compile cost is paid up front rather than on the first real
+        batch.
+        
+        If compiling fails, e.g. because Triton is missing, the model is run
+        uncompiled instead.
+        """
+        transformer = self.model[0]
+        if not hasattr(transformer, "auto_model"):
+            return
+        
+        console.print("Compiling model...", style="bold green")
+        eager_model = transformer.auto_model
+        transformer.auto_model = torch.compile(eager_model, dynamic=True)
+        try:
+            with torch.inference_mode():
+                self.model.encode(["warmup", "warm up the compiled model"])
+        except Exception as e:
+            # Inductor and Triton fail in many ways, none of which should
+            # stop the model from being used
+            transformer.auto_model = eager_model
+            console.print(
+                f"Compiling failed, running the model uncompiled: {e}", style="bold yellow"
+            )
+    
+    @property
+    def cache_name(self) -> str:
+        """Name to cache embeddings under; quantized models are kept apart."""
+        if self.backend == "torch":
+            return self.model_name
+        return f"{self.model_name} ({self.backend})"
+    
+    @property
+    def on_gpu(self) -> bool:
+        """Whether inference runs on a CUDA device rather than the CPU."""
+        return self.backend == "torch" and self.model.device.type == "cuda"
+    
+    @property
+    def tokenizer(self) -> Optional[PreTrainedTokenizerBase]:
+        """
+        The tokenizer of the underlying transformer.
+        
+        None for Model2Vec models, which tokenize as part of encoding, and
+        for tokenizers whose special tokens special_token_affixes can't find,
+        so their chunks are embedded from text.
+        """
+        if self._special_tokens is None:
+            return None
+        return self.model.tokenizer
+    
     def generate_embedding(self, text: str) -> List[float]:
         """
         Generate an embedding for a single text.
         
+        The last SINGLE_EMBEDDING_CACHE_SIZE texts are remembered, so calling
+        this repeatedly with the same text runs the model once. To embed many
+        texts, generate_embeddings is much faster.
+        
         Args:
             text: The text to embed
             
         Returns:
             List of embedding values
         """
-        with torch.no_grad():
-            embedding = self.model.encode(text)
-            return embedding.tolist()
+        if text in self._recent_embeddings:
+            self._recent_embeddings.move_to_end(text)
+        else:
+            self._recent_embeddings[text] = self.generate_embeddings([text])[0]
+            if len(self._recent_embeddings) > SINGLE_EMBEDDING_CACHE_SIZE:
+                self._recent_embeddings.popitem(last=False)
+        
+        return list(self._recent_embeddings[text])
     
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def generate_embeddings(
+        self, texts: List[str], batch_size: Optional[int] = None
+    ) -> List[List[float]]:
         """
         Generate embeddings for multiple texts.
         
         Args:
             texts: List of texts to embed
+            batch_size: Batch size passed to the model. If None, the model's
+                        own default is used.
             
         Returns:
             List of embedding vectors
         """
-        with torch.no_grad():
-            embeddings = self.model.encode(texts)
+        if not texts:
+            return []
+        
+        kwargs = {} if batch_size is None else {"batch_size": batch_size}
+        with torch.inference_mode():
+            embeddings = self.model.encode(texts, **kwargs)
             return embeddings.tolist()
     
-    def generate_embeddings_for_chunks(
-        self, chunks: List[CableChunk], batch_size: int = 8
-    ) -> Dict[str, List[float]]:
+    def generate_embeddings_from_ids(
+        self, input_ids: List[List[int]]
+    ) -> List[List[float]]:
+        """
+        Generate embeddings for texts that are already tokenized.
+        
+        Each sequence is truncated to the model's maximum length, given the
+        model's special tokens and padded, then run through the model
+        directly, bypassing encode()'s tokenization.
+        
+        Args:
+            input_ids: Token IDs for each text, without special tokens
+            
+        Returns:
+            List of embedding vectors
+        """
+        return self._forward(self._prepare_features(input_ids))
+    
+    def _prepare_features(self, input_ids: List[List[int]]) -> Dict[str, torch.Tensor]:
+        """
+        Build padded model inputs from token IDs, ready to copy to the device.
+        
+        On CUDA the tensors are pinned, so the copy to the GPU can run
+        asynchronously. This only touches the tokenizer, so it can run on a
+        different thread from the model.
+        
+        Args:
+            input_ids: Token IDs for each text, without special tokens
+            
+        Returns:
+            Dictionary of input tensors on the CPU
+        """
+        prefix, suffix = self._special_tokens
+        max_tokens = self.model.max_seq_length - len(prefix) - len(suffix)
+        
+        features = self.tokenizer.pad(
+            {"input_ids": [prefix + ids[:max_tokens] + suffix for ids in input_ids]},
+            return_tensors="pt",
+        )
+        if self.model.device.type == "cuda":
+            return {name: tensor.pin_memory() for name, tensor in features.items()}
+        return dict(features)
+    
+    def _forward(self, features: Dict[str, torch.Tensor]) -> List[List[float]]:
+        """
+        Run prepared inputs through the model.
+        
+        Args:
+            features: Input tensors as returned by _prepare_features
+            
+        Returns:
+            List of embedding vectors
+        """
+        device = self.model.device
+        features = {
+            name: tensor.to(device, non_blocking=True) for name, tensor in features.items()
+        }
+        
+        with torch.inference_mode():
+            embeddings = self.model(features)["sentence_embedding"]
+            return embeddings.float().cpu().tolist()
+    
+    def _prefetch_features(
+        self, chunks: List[CableChunk]
+    ) -> Optional[Dict[str, torch.Tensor]]:
         """
-        Generate embeddings for a list of cable chunks.
+        Prepare model inputs for a batch ahead of _embed_chunks.
         
         Args:
             chunks: List of CableChunk objects
-            batch_size: Number of chunks to process at once
             
         Returns:
-            Dictionary mapping chunk IDs to embeddings
+            Inputs for the batch's distinct chunks, or None if the chunks
+            were not tokenized during chunking
         """
-        results = {}
+        unique, _ = dedupe_by_text(chunks)
+        if not all(chunk.input_ids is not None for chunk in unique):
+            return None
+        return self._prepare_features([chunk.input_ids for chunk in unique])
+    
+    def _embed_chunks(
+        self,
+        chunks: List[CableChunk],
+        features: Optional[Dict[str, torch.Tensor]] = None,
+    ) -> List[List[float]]:
+        """
+        Embed a packed batch of chunks.
+        
+        Chunks that carry token IDs from chunking are embedded from those;
+        otherwise their text is encoded. Each distinct text is embedded once.
+        On GPU OOM, the batch is retried one chunk at a time.
         
-        with Progress(
-            TextColumn("[bold blue]{task.description}"),
-            BarColumn(),
-            TaskProgressColumn(),
-            TimeRemainingColumn(),
-        ) as progress:
-            task = progress.add_task("Generating embeddings...", total=len(chunks))
+        Args:
+            chunks: List of CableChunk objects
+            features: Inputs from _prefetch_features for these chunks, if
+                      they were prepared ahead of time
             
-            # Process in batches
-            for i in range(0, len(chunks), batch_size):
-                batch = chunks[i:i+batch_size]
-                texts = [chunk.text for chunk in batch]
-                
-                # Generate embeddings for the batch
-                batch_embeddings = self.generate_embeddings(texts)
+        Returns:
+            List of embedding vectors
+        """
+        unique, index = dedupe_by_text(chunks)
+        if len(unique) < len(chunks):
+            embeddings = self._embed_chunks(unique, features)
+            return [embeddings[i] for i in index]
+        
+        if all(chunk.input_ids is not None for chunk in chunks):
+            embed = self.generate_embeddings_from_ids
+            inputs = [chunk.input_ids for chunk in chunks]
+        else:
+            # Packed batches are already sized to fit, so encode each as one
+            embed = functools.partial(self.generate_embeddings, batch_size=len(chunks))
+            inputs = [chunk.text for chunk in chunks]
+        
+        try:
+            if features is not None:
+                return self._forward(features)
+            return embed(inputs)
+        except torch.cuda.OutOfMemoryError:
+            torch.cuda.empty_cache()
+            return [embed([single])[0] for single in inputs]
+    
+    def generate_embeddings_for_chunks(
+        self,
+        chunks: Iterable[CableChunk],
+        max_batch_chunks: int = 16,
+        max_batch_chars: Optional[int] = 16000,
+        cache: Optional[EmbeddingCache] = None,
+    ) -> ChunkEmbeddings:
+        """
+        Generate embeddings for a list or stream of cable chunks.
+        
+        Chunks are sorted by length and packed into batches bounded by both
+        count and total characters, which keeps padding waste low without
+        risking running out of memory on a batch of unusually long chunks.
+        With max_batch_chars set to None, batches are bounded by count alone,
+        as in SentenceTransformer.encode.
+        If a batch still does not fit on the GPU, it is retried one chunk at
+        a time. Chunks produced with the model's tokenizer are embedded from
+        their token IDs instead of being tokenized again.
+        
+        Packing runs on a producer thread feeding a bounded queue, so when
+        chunks is a lazy stream, chunking overlaps with inference. If
+        embedding fails or is interrupted, the producer stops and chunks is
+        closed, so a generator such as iter_cable_chunks shuts down its
+        process pool rather than being left blocked. The producer also looks
+        each batch up in the cache, through its own connection since SQLite
+        connections can't be shared between threads. For tokenized chunks it
+        then pads those that missed into (pinned, on CUDA) tensors, so the
+        main thread only copies them to the device and runs the model, and
+        fully cached batches are never tensorized.
+        
+        Args:
+            chunks: Iterable of CableChunk objects
+            max_batch_chunks: Maximum number of chunks to process at once
+            max_batch_chars: Maximum total characters to process at once, or
+                             None for no character limit
+            cache: Optional embedding cache. Chunks whose text is already
+                   cached are not re-embedded, and new embeddings are added.
+            
+        Returns:
+            ChunkEmbeddings holding each chunk's IDs and embedding
+        """
+        results = ChunkEmbeddings(len(chunks) if isinstance(chunks, Sized) else None)
+        batches = queue.Queue(maxsize=PIPELINE_DEPTH)
+        stop = threading.Event()
+        
+        def put(
+            item: Union[
+                Tuple[
+                    List[CableChunk],
+                    List[Optional[List[float]]],
+                    Optional[Dict[str, torch.Tensor]],
+                ],
+                BaseException,
+                None,
+            ],
+        ) -> bool:
+            # Give up once the consumer has stopped, rather than blocking on
+            # a full queue nobody will read
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        
+        def source() -> Iterator[CableChunk]:
+            try:
+                for chunk in chunks:
+                    if stop.is_set():
+                        return
+                    yield chunk
+            finally:
+                # Release whatever the chunk stream holds, e.g. the chunking
+                # process pool, even when embedding stops early
+                if hasattr(chunks, "close"):
+                    chunks.close()
+        
+        def produce() -> None:
+            chunk_source = source()
+            lookup = None
+            try:
+                if cache is not None:
+                    lookup = EmbeddingCache(cache.model_name, cache.path)
+                for batch in sorted_batches(chunk_source, max_batch_chunks, max_batch_chars):
+                    if lookup is None:
+                        cached = [None] * len(batch)
+                    else:
+                        cached = lookup.get_many([chunk.text for chunk in batch])
+                    misses = [chunk for chunk, embedding in zip(batch, cached) if embedding is None]
+                    features = self._prefetch_features(misses) if misses else None
+                    if not put((batch, cached, features)):
+                        return
+            except BaseException as e:
+                put(e)
+            finally:
+                chunk_source.close()
+                if lookup is not None:
+                    lookup.close()
+                put(None)
+        
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        
+        try:
+            with Progress(
+                TextColumn("[bold blue]{task.description}"),
+                BarColumn(),
+                TaskProgressColumn(),
+                TimeRemainingColumn(),
+                refresh_per_second=4,
+            ) as progress:
+                total = len(chunks) if isinstance(chunks, Sized) else None
+                task = progress.add_task("Generating embeddings...", total=total)
+                last_update = time.monotonic()
                 
-                # Store results
-                for j, chunk in enumerate(batch):
-                    chunk_id = f"{chunk.cable_id}_{chunk.chunk_id}"
-                    results[chunk_id] = batch_embeddings[j]
+                # Process in batches
+                while (item := batches.get()) is not None:
+                    if isinstance(item, BaseException):
+                        raise item
+                    batch, batch_embeddings, features = item
+                    
+                    # Embed the chunks that weren't cached, from the inputs
+                    # the producer prepared for them
+                    misses = [j for j, embedding in enumerate(batch_embeddings) if embedding is None]
+                    if misses:
+                        miss_chunks = [batch[j] for j in misses]
+                        miss_embeddings = self._embed_chunks(miss_chunks, features)
+                        if cache is not None:
+                            cache.put_many([chunk.text for chunk in miss_chunks], miss_embeddings)
+                        for j, embedding in zip(misses, miss_embeddings):
+                            batch_embeddings[j] = embedding
+                    
+                    results.extend(batch, batch_embeddings)
+                    
+                    # Updating takes the progress bar's lock, so only do it a few
+                    # times a second rather than after every batch
+                    if time.monotonic() - last_update >= PROGRESS_INTERVAL:
+                        progress.update(task, completed=len(results))
+                        last_update = time.monotonic()
                 
-                progress.update(task, advance=len(batch))
+                progress.update(task, completed=len(results))
+        finally:
+            stop.set()
+            # Unblock the producer if it is waiting to put a batch
+            with contextlib.suppress(queue.Empty):
+                while True:
+                    batches.get_nowait()
+            producer.join()
         
         return results
     
     def save_embeddings(
-        self, embeddings: Dict[str, List[float]], output_path: str
+        self, embeddings: ChunkEmbeddings, output_path: str, dtype: str = "int8"
     ) -> None:
         """
         Save embeddings to a file.
         
+        Vectors are stored int8-quantized (or as float16) in a safetensors
+        file, with the chunk metadata in a Parquet sidecar; see mapper.storage
+        for the layout.
+        
         Args:
-            embeddings: Dictionary mapping chunk IDs to embeddings
+            embeddings: Embeddings as returned by generate_embeddings_for_chunks
             output_path: Path to save the embeddings
+            dtype: Storage dtype, "int8" or "float16"
         """
-        # Convert to DataFrame
-        data = []
-        for chunk_id, embedding in embeddings.items():
-            cable_id, chunk_id_num = chunk_id.split('_')
-            data.append({
-                'cable_id': cable_id,
-                'chunk_id': int(chunk_id_num),
-                'embedding': embedding
-            })
-        
-        df = pd.DataFrame(data)
-        
-        # Save to file
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        df.to_pickle(output_path)
+        save_quantized_embeddings(
+            output_path,
+            cable_ids=embeddings.cable_ids,
+            chunk_ids=embeddings.chunk_ids,
+            vectors=embeddings.vectors,
+            dtype=dtype,
+        )
         console.print(f"Embeddings saved to {output_path}", style="bold green")
@@ -0,0 +1,189 @@
+"""
+Daemon mode for the cables CLI.
+
+This module provides a Unix socket server that runs CLI commands in a
+long-lived process, so loaded contexts and embedding models are reused
+across invocations, and the client side that forwards commands to it.
+"""
+
+import contextlib
+import io
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+from typing import Callable, List, Optional
+
+# The socket lives in a directory only this user can use: the per-user
+# runtime directory if there is one, otherwise a private directory that
+# serve creates in the shared temporary directory.
+DEFAULT_SOCKET_PATH = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR")
+    or os.path.join(tempfile.gettempdir(), f"mapper-{os.getuid()}"),
+    "mapper.sock",
+)
+
+
+def _check_directory(socket_path: str) -> None:
+    """
+    Make sure no other user controls the directory holding a socket.
+
+    Whoever owns the directory can replace the socket in it, so it must
+    belong to this user or to root.
+
+    Args:
+        socket_path: Path of the socket
+
+    Raises:
+        RuntimeError: If the directory belongs to another user.
+    """
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    if os.stat(directory).st_uid not in (os.getuid(), 0):
+        raise RuntimeError(f"{directory} belongs to another user")
+
+
+def _recv_all(conn: socket.socket) -> bytes:
+    """Read from a connection until the peer shuts down its write side."""
+    chunks = []
+    while data := conn.recv(65536):
+        chunks.append(data)
+    return b"".join(chunks)
+
+
+def forward(args: List[str], socket_path: str = DEFAULT_SOCKET_PATH) -> Optional[int]:
+    """
+    Run a command on a running server, if there is one.
+
+    The client's working directory is sent along so relative paths resolve
+    the same way they would in-process. The command's stdout and stderr are
+    written to this process's once the command finishes.
+
+    Args:
+        args: Command line arguments to forward
+        socket_path: Path to the server's Unix socket
+
+    Returns:
+        The command's exit code, or None if no server is listening
+
+    Raises:
+        RuntimeError: If socket_path is not a socket owned by this user, in
+                      a directory no other user controls. Anyone else could
+                      read the command and send back forged output.
+    """
+    try:
+        info = os.lstat(socket_path)
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise RuntimeError(f"{socket_path} is not a socket owned by this user")
+    _check_directory(socket_path)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        try:
+            conn.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+
+        request = {"args": args, "cwd": os.getcwd()}
+        conn.sendall(json.dumps(request).encode("utf-8"))
+        conn.shutdown(socket.SHUT_WR)
+        response = json.loads(_recv_all(conn).decode("utf-8"))
+
+    print(response.get("errors", ""), end="", file=sys.stderr)
+    print(response["output"], end="")
+    return response["exit_code"]
+
+
+def _run_request(data: bytes, handler: Callable[[List[str]], int]) -> dict:
+    """
+    Run a forwarded command and build the response to send back.
+
+    A malformed request gets an error response rather than stopping the
+    server.
+
+    Args:
+        data: The request as received
+        handler: Function that runs a command and returns its exit code
+
+    Returns:
+        Dictionary with the command's "exit_code", and its captured stdout
+        and stderr as "output" and "errors"
+    """
+    try:
+        request = json.loads(data.decode("utf-8"))
+        args, cwd = request["args"], request["cwd"]
+        if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+            raise TypeError("args must be a list of strings")
+        os.chdir(cwd)
+    except (ValueError, KeyError, TypeError, OSError) as e:
+        return {"exit_code": 1, "output": f"Error: invalid request: {e}\n"}
+
+    output = io.StringIO()
+    errors = io.StringIO()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(errors):
+        try:
+            exit_code = handler(args)
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 1
+
+    return {
+        "exit_code": exit_code,
+        "output": output.getvalue(),
+        "errors": errors.getvalue(),
+    }
+
+
+def serve(
+    handler: Callable[[List[str]], int], socket_path: str = DEFAULT_SOCKET_PATH
+) -> None:
+    """
+    Serve forwarded commands until interrupted.
+
+    Commands are handled one at a time. Each runs in the client's working
+    directory with stdout and stderr captured and returned to the client.
+    The socket's directory is created private to this user if it doesn't
+    exist.
+
+    Args:
+        handler: Function that runs a command and returns its exit code
+        socket_path: Path to listen on
+
+    Raises:
+        RuntimeError: If another server is already listening on socket_path,
+                      or another user controls its directory.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), mode=0o700, exist_ok=True)
+    _check_directory(socket_path)
+
+    if os.path.exists(socket_path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socket_path)
+            except ConnectionRefusedError:
+                # Left behind by a server that didn't shut down cleanly
+                os.unlink(socket_path)
+            else:
+                raise RuntimeError(f"A server is already listening on {socket_path}")
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        os.chmod(socket_path, 0o600)
+        server.listen()
+
+        try:
+            while True:
+                conn, _ = server.accept()
+                with conn:
+                    data = _recv_all(conn)
+                    if not data:
+                        # Probes (e.g. another server checking for us) send nothing
+                        continue
+
+                    response = _run_request(data, handler)
+                    # The client may have gone away while the command ran
+                    with contextlib.suppress(BrokenPipeError):
+                        conn.sendall(json.dumps(response).encode("utf-8"))
+        finally:
+            os.unlink(socket_path)
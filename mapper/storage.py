@@ -0,0 +1,200 @@
+"""
+Storage utilities for cable embeddings.
+
+This module provides functionality to persist embeddings as int8-quantized
+vectors with a per-vector scale, or as plain float16 vectors. Vectors (and
+scales) go in a safetensors file, which can be read without unpickling; the
+cable and chunk IDs go in a Parquet sidecar next to it.
+"""
+
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pydantic import BaseModel, ConfigDict, Field
+from safetensors import safe_open
+from safetensors.numpy import save_file
+from typing import List, Optional
+
+# Number of rows to dequantize at a time when loading.
+DEQUANTIZE_BATCH_SIZE = 4096
+
+# Rows per Parquet row group in the metadata sidecar.
+METADATA_ROW_GROUP_SIZE = 8192
+
+# Dtypes embeddings can be stored as.
+STORAGE_DTYPES = ("int8", "float16")
+
+
+class QuantizedEmbeddings(BaseModel):
+    """Stored embeddings with the metadata identifying each vector."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True, frozen=True)
+
+    vectors: np.ndarray = Field(
+        ..., description="int8 or float16 vectors of shape (N, D)"
+    )
+    scales: Optional[np.ndarray] = Field(
+        None, description="float32 scale for each int8 vector"
+    )
+    cable_ids: np.ndarray = Field(..., description="Cable ID for each vector")
+    chunk_ids: np.ndarray = Field(..., description="Chunk ID for each vector")
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+
+def metadata_path(embeddings_path: str) -> str:
+    """
+    Get the path of the Parquet sidecar for an embeddings file.
+
+    Args:
+        embeddings_path: Path to the safetensors embeddings file
+
+    Returns:
+        Path of the metadata file, e.g. embeddings.meta.parquet
+    """
+    return os.path.splitext(embeddings_path)[0] + ".meta.parquet"
+
+
+def save_quantized_embeddings(
+    output_path: str,
+    cable_ids: List[str],
+    chunk_ids: List[int],
+    vectors: np.ndarray,
+    dtype: str = "int8",
+) -> None:
+    """
+    Quantize embeddings and save them with their metadata.
+
+    For int8, each vector is scaled by max(|v|) / 127 so that its largest
+    component maps to +/-127. float16 keeps more precision at twice the size.
+
+    Args:
+        output_path: Path to save the embeddings (a .safetensors file)
+        cable_ids: Cable ID for each vector
+        chunk_ids: Chunk ID for each vector
+        vectors: Array of shape (N, D) holding the embeddings
+        dtype: Storage dtype, one of STORAGE_DTYPES
+
+    Raises:
+        ValueError: If dtype is not one of STORAGE_DTYPES.
+    """
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(
+            f"Unknown embeddings dtype '{dtype}', expected one of {', '.join(STORAGE_DTYPES)}"
+        )
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(cable_ids) == 0:
+        # Nothing was embedded, e.g. a search with no matches. reshape can't
+        # infer the width of an empty array, so keep whatever width it has.
+        vectors = vectors.reshape(0, vectors.shape[-1] if vectors.ndim == 2 else 0)
+    else:
+        vectors = vectors.reshape(len(cable_ids), -1)
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    if dtype == "float16":
+        tensors = {"vectors": vectors.astype(np.float16)}
+    else:
+        tensors = quantize_int8(vectors)
+    save_file(tensors, output_path)
+
+    # Written with pyarrow directly rather than through a DataFrame. Cables
+    # have many chunks each, so dictionary-encoding the cable IDs keeps the
+    # sidecar small.
+    metadata = pa.table({
+        "cable_id": pa.array(cable_ids, type=pa.string()).dictionary_encode(),
+        "chunk_id": pa.array(chunk_ids, type=pa.int32()),
+    })
+    pq.write_table(
+        metadata,
+        metadata_path(output_path),
+        compression="zstd",
+        row_group_size=METADATA_ROW_GROUP_SIZE,
+    )
+
+
+def quantize_int8(vectors: np.ndarray) -> dict:
+    """
+    Quantize float32 vectors to int8 with a float32 scale per vector.
+
+    Scales are kept at full precision: at 4 bytes per vector they cost
+    little, and float16 would overflow for large-norm vectors and
+    underflow to zero for very small ones.
+
+    Args:
+        vectors: Array of shape (N, D) holding float32 embeddings
+
+    Returns:
+        Dictionary with the int8 "vectors" and float32 "scales"
+    """
+    scales = (np.abs(vectors).max(axis=1, initial=0) / 127).astype(np.float32)
+    scales[scales == 0] = 1
+    quantized = np.round(vectors / scales[:, None])
+
+    return {
+        "vectors": np.clip(quantized, -127, 127).astype(np.int8),
+        "scales": scales,
+    }
+
+
+def load_quantized_embeddings(embeddings_path: str) -> QuantizedEmbeddings:
+    """
+    Load stored embeddings and their metadata.
+
+    The safetensors file is memory-mapped, so only the stored vectors (and
+    scales) are copied out; nothing is unpickled. The IDs are read straight
+    into arrays, without building a DataFrame.
+
+    Args:
+        embeddings_path: Path to the safetensors embeddings file
+
+    Returns:
+        The stored vectors, scales and IDs
+    """
+    with safe_open(embeddings_path, framework="numpy", device="cpu") as f:
+        vectors = f.get_tensor("vectors")
+        scales = f.get_tensor("scales") if "scales" in f.keys() else None
+
+    metadata = pq.read_table(metadata_path(embeddings_path))
+    return QuantizedEmbeddings(
+        vectors=vectors,
+        scales=scales,
+        cable_ids=metadata.column("cable_id").cast(pa.string()).to_numpy(),
+        chunk_ids=metadata.column("chunk_id").to_numpy(),
+    )
+
+
+def dequantize_embeddings(
+    embeddings: QuantizedEmbeddings, batch_size: int = DEQUANTIZE_BATCH_SIZE
+) -> np.ndarray:
+    """
+    Dequantize stored embeddings to float32, one batch of rows at a time.
+
+    float16 embeddings are just converted.
+
+    Args:
+        embeddings: Embeddings as returned by load_quantized_embeddings
+        batch_size: Number of rows to dequantize at once
+
+    Returns:
+        Array of shape (N, D) holding float32 embeddings
+    """
+    result = np.empty(embeddings.vectors.shape, dtype=np.float32)
+
+    if embeddings.scales is None:
+        result[:] = embeddings.vectors
+        return result
+
+    for i in range(0, len(embeddings), batch_size):
+        np.multiply(
+            embeddings.vectors[i : i + batch_size],
+            embeddings.scales[i : i + batch_size].astype(np.float32)[:, None],
+            out=result[i : i + batch_size],
+        )
+
+    return result
@@ -0,0 +1,26 @@
+"""
+Tests for the embedding cache.
+"""
+
+from mapper.cache import EmbeddingCache
+
+
+def test_cache_round_trip_and_misses(tmp_path):
+    """Stored embeddings are returned and unknown texts are misses."""
+    path = str(tmp_path / "cache.sqlite3")
+    with EmbeddingCache("model-a", path) as cache:
+        cache.put_many(["alpha", "beta"], [[1.0, 2.0], [3.0, 4.0]])
+        assert cache.get_many(["beta", "gamma", "alpha"]) == [
+            [3.0, 4.0],
+            None,
+            [1.0, 2.0],
+        ]
+
+
+def test_cache_is_keyed_by_model(tmp_path):
+    """Embeddings from one model are not served for another."""
+    path = str(tmp_path / "cache.sqlite3")
+    with EmbeddingCache("model-a", path) as cache:
+        cache.put_many(["alpha"], [[1.0, 2.0]])
+    with EmbeddingCache("model-b", path) as cache:
+        assert cache.get_many(["alpha"]) == [None]
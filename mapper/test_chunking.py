@@ -0,0 +1,41 @@
+"""
+Tests for splitting cables into chunks.
+"""
+
+import re
+
+import pytest
+
+from mapper import chunking
+from mapper.chunking import Phrase, chunk_cable
+
+
+def sentence_phrases(text: str) -> list[Phrase]:
+    """Split text after each full stop, standing in for spaCy."""
+    return [
+        Phrase(text=match.group(), start_char=match.start(), end_char=match.end())
+        for match in re.finditer(r"[^.]*\.\s*|[^.]+$", text)
+    ]
+
+
+@pytest.mark.parametrize(
+    "post_processor, byte_level", [("cls-sep", False), ("eos", True)]
+)
+def test_chunk_cable_token_ids_match_text(
+    monkeypatch, make_tokenizer, post_processor, byte_level
+):
+    """Each chunk carries exactly the tokens of its own text."""
+    monkeypatch.setattr(chunking, "get_phrases", sentence_phrases)
+    tokenizer = make_tokenizer(post_processor, byte_level=byte_level)
+    content = "Embassy talks. Subject: visit of the minister. Buenos Aires 2481."
+
+    chunks = chunk_cable("1", content, chunk_size=20, tokenizer=tokenizer)
+
+    assert [chunk.text for chunk in chunks] == [
+        "Embassy talks. ",
+        "Subject: visit of the minister. ",
+        "Buenos Aires 2481.",
+    ]
+    for chunk in chunks:
+        expected = tokenizer(chunk.text, add_special_tokens=False)["input_ids"]
+        assert chunk.input_ids == expected
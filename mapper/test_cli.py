@@ -3,9 +3,14 @@
 Test script for the cables CLI.
 """
 
+import io
 import os
 import sys
-from mapper.cli import main
+
+import pandas as pd
+
+from mapper import cli
+from mapper.cli import LARGE_RESULT_CHARS, flatten_chunks, main, print_result
 
 def test_cli():
     """Run a simple test of the CLI with the sample data."""
@@ -18,7 +23,7 @@ def test_cli():
     
     # Test basic loading
     print("Testing basic CSV loading...")
-    args = [sample_path]
+    args = [sample_path, "--no-daemon"]
     result = main(args)
     
     if result != 0:
@@ -27,7 +32,7 @@ def test_cli():
     
     # Test with a search term
     print("\nTesting search functionality...")
-    args = [sample_path, "--search", "SOVIET"]
+    args = [sample_path, "--search", "SOVIET", "--no-daemon"]
     result = main(args)
     
     if result != 0:
@@ -37,5 +42,41 @@ def test_cli():
     print("\nAll tests passed!")
     return 0
 
+def test_flatten_chunks_closes_source():
+    """Closing the flattened stream closes the per-cable stream behind it."""
+    closed = []
+
+    def cables():
+        try:
+            yield ["a", "b"]
+            yield ["c"]
+        finally:
+            closed.append(True)
+
+    chunks = flatten_chunks(cables())
+    assert next(chunks) == "a"
+    chunks.close()
+    assert closed == [True]
+
+
+def test_print_result_streams_parseable_csv(capsys):
+    """Large results are written to stdout as nothing but CSV."""
+    result = pd.DataFrame({"id": [1, 2], "content": ["x" * LARGE_RESULT_CHARS] * 2})
+
+    assert print_result(result) is True
+    assert pd.read_csv(io.StringIO(capsys.readouterr().out)).equals(result)
+
+
+def test_plot_window_is_not_forwarded(monkeypatch):
+    """--visualize without --output runs here, where the window can open."""
+    forwarded = []
+    monkeypatch.setattr(cli, "forward", lambda *args: forwarded.append(args))
+
+    main(["cables.csv", "--visualize"])
+    main(["cables.csv", "--visualize", "--output", "plot.png"])
+
+    assert len(forwarded) == 1
+
+
 if __name__ == "__main__":
     sys.exit(test_cli())
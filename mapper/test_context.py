@@ -0,0 +1,121 @@
+"""
+Tests for searching the sample cables with CablesContext.
+"""
+
+import gzip
+import os
+
+import pytest
+
+from mapper.context import CablesContext
+
+SAMPLE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "cables_sample.csv"
+)
+
+
+@pytest.fixture(scope="module")
+def context() -> CablesContext:
+    """Context with the sample cables loaded."""
+    return CablesContext(SAMPLE_PATH)
+
+
+def test_search_text_is_case_insensitive(context):
+    """Lower-case search text matches upper-case cable content."""
+    result = context.search_cables(text="tehran")
+    assert list(result["id"]) == ["2"]
+
+
+def test_search_text_is_literal(context):
+    """LIKE wildcards in search text are not treated as patterns."""
+    assert len(context.search_cables(text="%")) == 0
+
+
+def test_search_terms_match_any(context):
+    """Multiple terms match cables containing any one of them."""
+    result = context.search_cables(terms=["no such phrase", "buenos aires"])
+    assert list(result["id"]) == ["1"]
+
+
+def test_search_limit(context):
+    """The limit caps the number of rows returned."""
+    assert len(context.search_cables(limit=1)) == 1
+
+
+def test_search_dictionary_columns(context):
+    """Filters on dictionary-encoded classification and source still match."""
+    result = context.search_cables(classification="UNCLASSIFIED", source="Tehran")
+    assert list(result["id"]) == ["2"]
+    assert len(context.search_cables(classification="SECRET")) == 0
+
+
+def test_load_compressed_csv(tmp_path):
+    """Gzipped dumps are decompressed while scanning."""
+    path = tmp_path / "cables.csv.gz"
+    with open(SAMPLE_PATH, "rb") as src, gzip.open(path, "wb") as dst:
+        dst.write(src.read())
+
+    result = CablesContext(str(path)).search_cables(text="tehran")
+    assert list(result["id"]) == ["2"]
+
+
+def test_search_date_range_is_chronological(context):
+    """Date filters compare parsed dates, not MM/DD/YYYY strings."""
+    # As strings, "2/25/1972" sorts before "12/28/1966".
+    assert list(context.search_cables(date_from="01/01/1970")["id"]) == ["2"]
+    assert list(context.search_cables(date_to="12/28/1966")["id"]) == ["1"]
+    assert list(context.search_cables()["id"]) == ["1", "2"]
+
+
+def test_search_rejects_malformed_date(context):
+    """Dates not in MM/DD/YYYY format raise a clear error."""
+    with pytest.raises(ValueError, match="MM/DD/YYYY"):
+        context.search_cables(date_from="1970-01-01")
+
+
+def test_execute_query_limit(context):
+    """Custom queries are capped by the limit."""
+    assert len(context.execute_query("SELECT id FROM cables")) == 2
+    assert len(context.execute_query("SELECT id FROM cables", limit=1)) == 1
+
+
+def test_get_cable_by_id(context):
+    """Lookups return the matching cable and treat the ID as a literal."""
+    assert list(context.get_cable_by_id("2")["id"]) == ["2"]
+    assert context.get_cable_by_id("2' OR '1'='1").empty
+
+
+def test_search_tolerates_unparseable_dates(tmp_path):
+    """Date-only and malformed dates don't break searching the table."""
+    path = tmp_path / "cables.csv"
+    with open(SAMPLE_PATH) as src:
+        sample = src.read()
+    path.write_text(
+        sample
+        + '"3","1/5/1970","","Embassy Rome","UNCLASSIFIED","","","DATE ONLY"\n'
+        + '"4","sometime","","Embassy Rome","UNCLASSIFIED","","","NO DATE"\n'
+    )
+    context = CablesContext(str(path))
+
+    assert list(context.search_cables()["id"]) == ["1", "3", "2", "4"]
+    assert list(context.search_cables(text="date only")["id"]) == ["3"]
+    assert list(context.search_cables(date_from="01/05/1970")["id"]) == ["3", "2"]
+
+
+def test_load_rejects_wrong_column_count(tmp_path):
+    """A CSV without one column per schema field is rejected when loaded."""
+    path = tmp_path / "cables.csv"
+    path.write_text('"1","12/28/1966 18:48","too few columns"\n')
+
+    with pytest.raises(ValueError, match="3 columns, expected 8"):
+        CablesContext(str(path))
+
+
+def test_iter_cable_chunks_attaches_metadata(context, monkeypatch):
+    """Chunks come back in table order with their own cable's metadata."""
+    monkeypatch.setattr("mapper.context.CHUNK_TASK_SIZE", 1)
+    cables = list(context.iter_cable_chunks(max_workers=1))
+
+    assert [chunks[0].cable_id for chunks in cables] == ["1", "2"]
+    assert [chunks[0].date for chunks in cables] == ["12/28/1966 18:48", "2/25/1972 9:30"]
+    assert all(chunk.source == chunks[0].source for chunks in cables for chunk in chunks)
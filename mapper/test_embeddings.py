@@ -0,0 +1,270 @@
+"""
+Tests for the embedding utilities that don't need a model.
+"""
+
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+
+from mapper import embeddings
+from mapper.cache import EmbeddingCache
+from mapper.chunking import CableChunk
+from mapper.embeddings import (
+    ChunkEmbeddings,
+    EmbeddingModel,
+    dedupe_by_text,
+    default_backend,
+    pack_batches,
+    sorted_batches,
+    special_token_affixes,
+)
+
+
+def make_chunk(chunk_id: int, length: int) -> CableChunk:
+    """Build a chunk with text of the given length."""
+    return CableChunk(
+        cable_id="1",
+        chunk_id=chunk_id,
+        text="x" * length,
+        start_char=0,
+        end_char=length,
+    )
+
+
+def test_pack_batches_respects_chunk_limit():
+    """Batches never hold more than max_batch_chunks chunks."""
+    chunks = [make_chunk(i, 10) for i in range(5)]
+    batches = list(pack_batches(chunks, max_batch_chunks=2, max_batch_chars=1000))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+
+def test_pack_batches_respects_char_limit():
+    """Batches are split before exceeding max_batch_chars."""
+    chunks = [make_chunk(i, length) for i, length in enumerate([40, 40, 40, 100])]
+    batches = list(pack_batches(chunks, max_batch_chunks=10, max_batch_chars=100))
+    assert [[chunk.chunk_id for chunk in batch] for batch in batches] == [
+        [0, 1],
+        [2],
+        [3],
+    ]
+
+
+def test_pack_batches_without_char_limit():
+    """With no character budget, batches are bounded by count alone."""
+    chunks = [make_chunk(i, 1000) for i in range(5)]
+    batches = list(pack_batches(chunks, max_batch_chunks=2, max_batch_chars=None))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+
+def test_pack_batches_oversized_chunk_gets_own_batch():
+    """A chunk larger than the character budget is still emitted."""
+    chunks = [make_chunk(0, 500)]
+    batches = list(pack_batches(chunks, max_batch_chunks=10, max_batch_chars=100))
+    assert len(batches) == 1 and batches[0][0].chunk_id == 0
+
+
+def test_sorted_batches_sorts_within_window():
+    """Chunks are length-sorted inside each window but windows keep order."""
+    lengths = [30, 10, 20, 5, 1]
+    chunks = iter([make_chunk(i, length) for i, length in enumerate(lengths)])
+    batches = list(
+        sorted_batches(chunks, max_batch_chunks=1, max_batch_chars=1000, sort_window=3)
+    )
+    assert [batch[0].chunk_id for batch in batches] == [1, 2, 0, 4, 3]
+
+
+def test_sorted_batches_prefers_token_length():
+    """Tokenized chunks are sorted by token count rather than characters."""
+    chunks = [make_chunk(0, 10), make_chunk(1, 30)]
+    chunks[0].input_ids = [0] * 8
+    chunks[1].input_ids = [0] * 4
+    batches = list(sorted_batches(chunks, max_batch_chunks=1, max_batch_chars=1000))
+    assert [batch[0].chunk_id for batch in batches] == [1, 0]
+
+
+def test_dedupe_by_text():
+    """Repeated texts map back to the first chunk with that text."""
+    chunks = [make_chunk(0, 5), make_chunk(1, 7), make_chunk(2, 5)]
+    unique, index = dedupe_by_text(chunks)
+    assert [chunk.chunk_id for chunk in unique] == [0, 1]
+    assert index == [0, 1, 0]
+
+
+def test_chunk_embeddings_grow():
+    """Embeddings are kept in order as the buffer grows past its capacity."""
+    embeddings = ChunkEmbeddings(capacity=2)
+    for i in range(3):
+        embeddings.extend([make_chunk(i, 1)], [[float(i), 0.0]])
+    assert len(embeddings) == 3
+    assert embeddings.chunk_ids == [0, 1, 2]
+    assert embeddings.vectors[:, 0].tolist() == [0.0, 1.0, 2.0]
+
+
+def fake_model(embed) -> EmbeddingModel:
+    """An EmbeddingModel that embeds batches with embed instead of a model."""
+    model = EmbeddingModel.__new__(EmbeddingModel)
+    model._prefetch_features = lambda chunks: None
+    model._embed_chunks = lambda chunks, features=None: embed(chunks)
+    return model
+
+
+def test_pipeline_embeds_before_source_is_exhausted():
+    """The first batch is embedded while the chunk source is still producing."""
+    embedded = threading.Event()
+
+    def embed(chunks):
+        embedded.set()
+        return [[float(chunk.chunk_id)] for chunk in chunks]
+
+    def chunks():
+        # One full sort window, then hold back the rest until a batch is in
+        yield from (make_chunk(i, 1) for i in range(1024))
+        assert embedded.wait(timeout=10), "nothing embedded before the source finished"
+        yield make_chunk(1024, 1)
+
+    results = fake_model(embed).generate_embeddings_for_chunks(chunks())
+    assert len(results) == 1025
+
+
+def test_pipeline_stops_producer_on_error():
+    """If embedding fails, the producer exits and the chunk source is closed."""
+    closed = threading.Event()
+
+    def embed(chunks):
+        raise RuntimeError("embedding failed")
+
+    def chunks():
+        try:
+            for i in range(10**6):
+                yield make_chunk(i, 1)
+        finally:
+            closed.set()
+
+    threads = threading.active_count()
+    with pytest.raises(RuntimeError, match="embedding failed"):
+        fake_model(embed).generate_embeddings_for_chunks(chunks(), max_batch_chunks=1)
+
+    assert closed.is_set()
+    assert threading.active_count() == threads
+
+
+def test_generate_embeddings_empty():
+    """No texts give no embeddings without calling the model."""
+    assert fake_model(lambda chunks: []).generate_embeddings([]) == []
+
+
+class RecordingEncoder:
+    """Stands in for a SentenceTransformer, recording encode's batch sizes."""
+
+    def __init__(self) -> None:
+        self.batch_sizes = []
+
+    def encode(self, texts, **kwargs):
+        self.batch_sizes.append(kwargs.get("batch_size"))
+        return np.zeros((len(texts), 2), dtype=np.float32)
+
+
+def test_generate_embeddings_keeps_default_batch_size():
+    """Direct callers get the model's batch size; packed batches are one batch."""
+    model = EmbeddingModel.__new__(EmbeddingModel)
+    model.model = RecordingEncoder()
+
+    model.generate_embeddings(["a"] * 100)
+    model._embed_chunks([make_chunk(i, i + 1) for i in range(3)])
+
+    assert model.model.batch_sizes == [None, 3]
+
+
+@pytest.mark.parametrize(
+    "post_processor, expected", [("cls-sep", ([2], [3])), ("eos", ([], [4]))]
+)
+def test_special_token_affixes(make_tokenizer, post_processor, expected):
+    """Special tokens added only by the post-processor are found."""
+    assert special_token_affixes(make_tokenizer(post_processor)) == expected
+
+
+@pytest.mark.parametrize("post_processor", ["cls-sep", "eos"])
+def test_features_from_ids_match_text(make_tokenizer, post_processor):
+    """Inputs built from token IDs are those encode builds from the text."""
+    tokenizer = make_tokenizer(post_processor)
+    model = EmbeddingModel.__new__(EmbeddingModel)
+    model.model = SimpleNamespace(
+        tokenizer=tokenizer, max_seq_length=6, device=torch.device("cpu")
+    )
+    model._special_tokens = special_token_affixes(tokenizer)
+    texts = ["Embassy talks.", "Subject: visit of the minister, Buenos Aires 2481."]
+
+    features = model._prepare_features(
+        [tokenizer(text, add_special_tokens=False)["input_ids"] for text in texts]
+    )
+
+    expected = tokenizer(
+        texts, padding=True, truncation=True, max_length=6, return_tensors="pt"
+    )
+    assert torch.equal(features["input_ids"], expected["input_ids"])
+    assert torch.equal(features["attention_mask"], expected["attention_mask"])
+
+
+@pytest.mark.parametrize(
+    "installed, expected",
+    [
+        ({"openvino", "optimum", "optimum.intel", "onnxruntime"}, "openvino"),
+        ({"openvino", "onnxruntime", "optimum"}, "onnx"),
+        ({"openvino", "onnxruntime"}, "torch"),
+    ],
+)
+def test_default_backend(monkeypatch, installed, expected):
+    """On CPU, the backend depends on what is installed, missing parents included."""
+
+    def find_spec(name):
+        if "." in name and name.split(".")[0] not in installed:
+            raise ModuleNotFoundError(f"No module named '{name.split('.')[0]}'")
+        return object() if name in installed else None
+
+    monkeypatch.setattr(embeddings.torch.cuda, "is_available", lambda: False)
+    monkeypatch.setattr(embeddings.importlib.util, "find_spec", find_spec)
+    assert default_backend() == expected
+
+
+
+class FailingTransformer(list):
+    """Stands in for a SentenceTransformer whose compiled model won't run."""
+
+    def encode(self, texts):
+        raise RuntimeError("Cannot find a working triton installation")
+
+
+def test_compile_failure_falls_back_to_eager():
+    """If the compiled model fails to warm up, the uncompiled one is kept."""
+    eager_model = torch.nn.Linear(2, 2)
+    model = EmbeddingModel.__new__(EmbeddingModel)
+    model.model = FailingTransformer([SimpleNamespace(auto_model=eager_model)])
+
+    model._compile()
+
+    assert model.model[0].auto_model is eager_model
+
+
+def test_pipeline_prefetches_only_cache_misses(tmp_path):
+    """Inputs are only prepared for chunks the cache doesn't already hold."""
+    prefetched = []
+    model = EmbeddingModel.__new__(EmbeddingModel)
+    model._prefetch_features = lambda chunks: prefetched.append(
+        [chunk.chunk_id for chunk in chunks]
+    )
+    model._embed_chunks = lambda chunks, features=None: [
+        [float(chunk.chunk_id)] for chunk in chunks
+    ]
+    chunks = [make_chunk(i, i + 1) for i in range(6)]
+
+    with EmbeddingCache("model", str(tmp_path / "cache.sqlite3")) as cache:
+        cache.put_many([chunk.text for chunk in chunks[:3]], [[-1.0]] * 3)
+        results = model.generate_embeddings_for_chunks(
+            chunks, max_batch_chunks=2, cache=cache
+        )
+
+    assert prefetched == [[3], [4, 5]]
+    assert results.vectors[:, 0].tolist() == [-1.0, -1.0, -1.0, 3.0, 4.0, 5.0]
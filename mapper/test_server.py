@@ -0,0 +1,78 @@
+"""
+Tests for forwarding CLI commands to a daemon.
+"""
+
+import json
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+from mapper.server import forward, serve
+
+
+def test_forward_without_server_returns_none(tmp_path):
+    """With nothing listening, the caller falls back to running in-process."""
+    assert forward(["cables.csv"], str(tmp_path / "missing.sock")) is None
+
+
+def start_server(socket_path: str) -> None:
+    """Start a server whose commands print their arguments and exit with 3."""
+
+    def handler(args):
+        print("ran", *args)
+        print("status", file=sys.stderr)
+        return 3
+
+    thread = threading.Thread(target=serve, args=(handler, socket_path), daemon=True)
+    thread.start()
+
+    for _ in range(100):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(socket_path)
+            return
+        except (FileNotFoundError, ConnectionRefusedError):
+            time.sleep(0.01)
+
+
+def test_forward_round_trip(tmp_path, capsys):
+    """Forwarded commands run in the server and their output comes back."""
+    socket_path = str(tmp_path / "mapper.sock")
+    start_server(socket_path)
+
+    exit_code = forward(["a", "b"], socket_path)
+
+    assert exit_code == 3
+    captured = capsys.readouterr()
+    assert captured.out == "ran a b\n"
+    assert captured.err == "status\n"
+
+
+def test_forward_refuses_non_socket(tmp_path):
+    """A file that isn't this user's socket is never sent the command."""
+    socket_path = tmp_path / "mapper.sock"
+    socket_path.write_text("")
+
+    with pytest.raises(RuntimeError, match="not a socket owned by this user"):
+        forward(["cables.csv"], str(socket_path))
+
+
+def test_server_survives_malformed_request(tmp_path, capsys):
+    """A request with a bad cwd or missing keys gets an error, not a crash."""
+    socket_path = str(tmp_path / "mapper.sock")
+    start_server(socket_path)
+
+    for request in [{"args": ["a"], "cwd": str(tmp_path / "missing")}, {}, []]:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(socket_path)
+            conn.sendall(json.dumps(request).encode("utf-8"))
+            conn.shutdown(socket.SHUT_WR)
+            response = json.loads(conn.recv(65536).decode("utf-8"))
+        assert response["exit_code"] == 1
+        assert response["output"].startswith("Error: invalid request")
+
+    assert forward(["a"], socket_path) == 3
+    assert capsys.readouterr().out == "ran a\n"
@@ -0,0 +1,78 @@
+"""
+Tests for embedding storage.
+"""
+
+import os
+
+import numpy as np
+
+from mapper.storage import (
+    dequantize_embeddings,
+    load_quantized_embeddings,
+    metadata_path,
+    save_quantized_embeddings,
+)
+
+
+def test_quantized_round_trip(tmp_path):
+    """Saved embeddings load back with their IDs and within int8 error."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(5, 16)).astype(np.float32)
+    path = str(tmp_path / "embeddings.safetensors")
+
+    save_quantized_embeddings(
+        path,
+        cable_ids=["1", "1", "2", "2", "10"],
+        chunk_ids=[0, 1, 0, 1, 0],
+        vectors=vectors,
+    )
+    assert os.path.exists(metadata_path(path))
+
+    embeddings = load_quantized_embeddings(path)
+    assert embeddings.vectors.dtype == np.int8
+    assert list(embeddings.cable_ids) == ["1", "1", "2", "2", "10"]
+    assert list(embeddings.chunk_ids) == [0, 1, 0, 1, 0]
+
+    restored = dequantize_embeddings(embeddings, batch_size=2)
+    tolerance = np.abs(vectors).max(axis=1, keepdims=True) / 127
+    assert np.all(np.abs(restored - vectors) <= tolerance)
+
+
+def test_float16_round_trip(tmp_path):
+    """float16 embeddings are stored without scales and load back closely."""
+    vectors = np.random.default_rng(0).normal(size=(3, 8)).astype(np.float32)
+    path = str(tmp_path / "embeddings.safetensors")
+
+    save_quantized_embeddings(
+        path, cable_ids=["1", "2", "3"], chunk_ids=[0, 0, 0], vectors=vectors, dtype="float16"
+    )
+
+    embeddings = load_quantized_embeddings(path)
+    assert embeddings.vectors.dtype == np.float16
+    assert embeddings.scales is None
+    np.testing.assert_allclose(dequantize_embeddings(embeddings), vectors, rtol=1e-3)
+
+
+def test_save_no_embeddings(tmp_path):
+    """An empty set of embeddings saves and loads back empty."""
+    path = str(tmp_path / "embeddings.safetensors")
+
+    save_quantized_embeddings(
+        path, cable_ids=[], chunk_ids=[], vectors=np.empty((0, 0), dtype=np.float32)
+    )
+
+    embeddings = load_quantized_embeddings(path)
+    assert len(embeddings) == 0
+    assert len(embeddings.cable_ids) == 0
+    assert dequantize_embeddings(embeddings).shape[0] == 0
+
+
+def test_quantize_extreme_norms(tmp_path):
+    """Scales hold vectors too large or too small for float16."""
+    vectors = np.array([[1e7, -1e7, 5e6], [1e-9, -2e-9, 0.0]], dtype=np.float32)
+    path = str(tmp_path / "embeddings.safetensors")
+
+    save_quantized_embeddings(path, cable_ids=["1", "2"], chunk_ids=[0, 0], vectors=vectors)
+
+    restored = dequantize_embeddings(load_quantized_embeddings(path))
+    np.testing.assert_allclose(restored, vectors, rtol=1e-2, atol=0)
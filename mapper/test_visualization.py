@@ -0,0 +1,105 @@
+"""
+Tests for t-SNE plotting, run with matplotlib's non-interactive backend.
+"""
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+import pytest
+
+from mapper import visualization
+from mapper.storage import QuantizedEmbeddings
+from mapper.visualization import MAX_LEGEND_ENTRIES, create_tsne_plot, run_tsne
+
+
+def make_embeddings(n: int, dims: int = 64, cables: int = 3) -> QuantizedEmbeddings:
+    """Build random float16 embeddings spread over the given number of cables."""
+    rng = np.random.default_rng(0)
+    return QuantizedEmbeddings(
+        vectors=rng.normal(size=(n, dims)).astype(np.float16),
+        cable_ids=np.array([str(i % cables) for i in range(n)]),
+        chunk_ids=np.arange(n),
+    )
+
+
+@pytest.fixture
+def plotted_figures(monkeypatch):
+    """Keep the figures create_tsne_plot closes, and skip the t-SNE itself."""
+    figures = []
+    monkeypatch.setattr(visualization.plt, "close", figures.append)
+    monkeypatch.setattr(
+        visualization,
+        "run_tsne",
+        lambda embeddings, **kwargs: np.random.default_rng(0).normal(
+            size=(len(embeddings), 2)
+        ),
+    )
+    return figures
+
+
+def test_run_tsne_falls_back_to_sklearn(monkeypatch):
+    """Without cuML or openTSNE, scikit-learn's t-SNE gives 2D points."""
+    monkeypatch.setattr(visualization, "_cuda_device_count", lambda: 0)
+    monkeypatch.setattr(visualization.importlib.util, "find_spec", lambda name: None)
+
+    points = run_tsne(make_embeddings(60), perplexity=5, n_iter=250)
+
+    assert points.shape == (60, 2)
+
+
+@pytest.mark.parametrize("reduce_dims, pca_calls", [(True, 1), (False, 0)])
+def test_run_tsne_reduces_dims_with_pca(monkeypatch, reduce_dims, pca_calls):
+    """PCA runs before t-SNE only when asked to."""
+    fitted = []
+
+    class RecordingPCA(visualization.PCA):
+        def fit_transform(self, X, y=None):
+            fitted.append(X.shape)
+            return super().fit_transform(X, y)
+
+    monkeypatch.setattr(visualization, "_cuda_device_count", lambda: 0)
+    monkeypatch.setattr(visualization.importlib.util, "find_spec", lambda name: None)
+    monkeypatch.setattr(visualization, "PCA", RecordingPCA)
+
+    points = run_tsne(
+        make_embeddings(60), perplexity=5, n_iter=250, reduce_dims=reduce_dims
+    )
+
+    assert points.shape == (60, 2)
+    assert fitted == [(60, 64)] * pca_calls
+
+
+@pytest.mark.parametrize("points, rasterized", [(19, False), (20, True)])
+def test_rasterize_from_datashader_threshold(
+    tmp_path, monkeypatch, plotted_figures, points, rasterized
+):
+    """Plots are rasterized from DATASHADER_MIN_POINTS points, without a legend."""
+    drawn = []
+    monkeypatch.setattr(visualization, "DATASHADER_MIN_POINTS", 20)
+    monkeypatch.setattr(
+        visualization.importlib.util, "find_spec", lambda name: object()
+    )
+    monkeypatch.setattr(
+        visualization, "_draw_rasterized", lambda ax, *args: drawn.append(ax)
+    )
+
+    create_tsne_plot(make_embeddings(points), output_path=str(tmp_path / "plot.png"))
+
+    assert bool(drawn) == rasterized
+    assert (plotted_figures[0].axes[0].get_legend() is None) == rasterized
+
+
+@pytest.mark.parametrize(
+    "cables, has_legend",
+    [(MAX_LEGEND_ENTRIES, True), (MAX_LEGEND_ENTRIES + 1, False)],
+)
+def test_legend_only_for_few_cables(tmp_path, plotted_figures, cables, has_legend):
+    """Plots of more than MAX_LEGEND_ENTRIES cables get no legend by default."""
+    embeddings = make_embeddings(2 * cables, cables=cables)
+
+    create_tsne_plot(embeddings, output_path=str(tmp_path / "plot.png"))
+
+    legend = plotted_figures[0].axes[0].get_legend()
+    assert (legend is not None) == has_legend
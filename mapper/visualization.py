@@ -5,103 +5,291 @@ This module provides functionality to visualize embeddings using dimensionality
 reduction techniques like t-SNE.
 """
 
+import importlib.util
 import os
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+from sklearn.decomposition import PCA
 from sklearn.manifold import TSNE
 from typing import List, Dict, Optional, Union, Tuple
 from rich.console import Console
 
+from mapper.storage import (
+    QuantizedEmbeddings,
+    dequantize_embeddings,
+    load_quantized_embeddings,
+)
+
 console = Console()
 
+# Number of points from which plots are rasterized with datashader instead of
+# drawing a marker per point.
+DATASHADER_MIN_POINTS = 2000
+
+# Most cable IDs a plot draws a legend for by default.
+MAX_LEGEND_ENTRIES = 50
+
+# Dimensions embeddings are reduced to with PCA before t-SNE.
+PCA_COMPONENTS = 50
+
+# Iterations sklearn spends in early exaggeration, counted within its max_iter;
+# openTSNE runs these on top of its own n_iter.
+EARLY_EXAGGERATION_ITER = 250
 
-def load_embeddings(embeddings_path: str) -> pd.DataFrame:
+
+def load_embeddings(embeddings_path: str) -> QuantizedEmbeddings:
     """
-    Load embeddings from a pickle file.
+    Load embeddings from a quantized embeddings file.
+    
+    Vectors stay in their stored int8 or float16 form until t-SNE needs them.
     
     Args:
-        embeddings_path: Path to the embeddings pickle file
+        embeddings_path: Path to the safetensors embeddings file
         
     Returns:
-        DataFrame containing the embeddings
+        QuantizedEmbeddings containing the vectors and their IDs
     """
     if not os.path.exists(embeddings_path):
         raise FileNotFoundError(f"Embeddings file not found: {embeddings_path}")
     
-    df = pd.read_pickle(embeddings_path)
-    console.print(f"Loaded embeddings for {len(df)} chunks", style="bold green")
-    return df
+    embeddings = load_quantized_embeddings(embeddings_path)
+    console.print(f"Loaded embeddings for {len(embeddings)} chunks", style="bold green")
+    return embeddings
+
+
+def _cuda_device_count() -> int:
+    """Return the number of CUDA devices cuML can use, or 0 if it isn't installed."""
+    try:
+        import cupy
+        import cuml  # noqa: F401
+    except ImportError:
+        return 0
+    
+    try:
+        return cupy.cuda.runtime.getDeviceCount()
+    except cupy.cuda.runtime.CUDARuntimeError:
+        return 0
+
+
+def _pca_components(shape: Tuple[int, int]) -> int:
+    """Number of PCA components to keep for an (N, D) array of embeddings."""
+    return min(PCA_COMPONENTS, *shape)
+
+
+def run_tsne(
+    embeddings: QuantizedEmbeddings,
+    perplexity: int = 30,
+    n_iter: int = 1000,
+    random_state: int = 42,
+    reduce_dims: bool = True,
+) -> np.ndarray:
+    """
+    Reduce stored embeddings to two dimensions with t-SNE.
+    
+    Uses cuML's GPU implementation when cuML and a CUDA device are available,
+    dequantizing directly on the device. Otherwise uses openTSNE's
+    multi-threaded FFT-accelerated implementation if it is installed, falling
+    back to scikit-learn.
+    
+    By default the embeddings are first reduced to PCA_COMPONENTS dimensions
+    with PCA. This keeps the neighbourhood structure t-SNE works from while
+    making each pairwise distance far cheaper to compute.
+    
+    Args:
+        embeddings: Embeddings as returned by load_embeddings
+        perplexity: Perplexity parameter for t-SNE
+        n_iter: Number of iterations for t-SNE
+        random_state: Random state for reproducibility
+        reduce_dims: Whether to reduce the embeddings with PCA first
+        
+    Returns:
+        Array of shape (N, 2) with the t-SNE coordinates
+    """
+    if _cuda_device_count() > 0:
+        import cupy
+        from cuml.manifold import TSNE as cuTSNE
+        
+        console.print("Applying t-SNE dimensionality reduction on GPU...", style="bold blue")
+        vectors = cupy.asarray(embeddings.vectors).astype(cupy.float32)
+        if embeddings.scales is not None:
+            vectors *= cupy.asarray(embeddings.scales).astype(cupy.float32)[:, None]
+        if reduce_dims and _pca_components(vectors.shape) < vectors.shape[1]:
+            from cuml.decomposition import PCA as cuPCA
+            
+            vectors = cuPCA(n_components=_pca_components(vectors.shape)).fit_transform(vectors)
+        tsne = cuTSNE(
+            n_components=2,
+            perplexity=perplexity,
+            n_iter=n_iter,
+            random_state=random_state
+        )
+        return cupy.asnumpy(tsne.fit_transform(vectors))
+    
+    vectors = dequantize_embeddings(embeddings)
+    if reduce_dims and _pca_components(vectors.shape) < vectors.shape[1]:
+        pca = PCA(n_components=_pca_components(vectors.shape), random_state=random_state)
+        vectors = pca.fit_transform(vectors)
+    
+    if importlib.util.find_spec("openTSNE"):
+        from openTSNE import TSNE as OpenTSNE
+        
+        console.print("Applying t-SNE dimensionality reduction with openTSNE...", style="bold blue")
+        tsne = OpenTSNE(
+            n_components=2,
+            perplexity=perplexity,
+            early_exaggeration_iter=EARLY_EXAGGERATION_ITER,
+            n_iter=max(n_iter - EARLY_EXAGGERATION_ITER, 0),
+            random_state=random_state,
+            n_jobs=-1
+        )
+        return np.asarray(tsne.fit(vectors))
+    
+    console.print("Applying t-SNE dimensionality reduction...", style="bold blue")
+    tsne = TSNE(
+        n_components=2,
+        perplexity=perplexity,
+        max_iter=n_iter,
+        random_state=random_state
+    )
+    return tsne.fit_transform(vectors)
+
+
+def _draw_rasterized(ax: plt.Axes, points: np.ndarray, cable_ids: np.ndarray) -> None:
+    """
+    Draw points colored by cable ID as a single aggregated image.
+    
+    datashader bins the points into pixels in vectorized code, so drawing
+    time and output size stay flat however many points there are.
+    
+    Args:
+        ax: Axes to draw on
+        points: Array of shape (N, 2) with the coordinates to plot
+        cable_ids: Cable ID for each point
+    """
+    import datashader as ds
+    import datashader.transfer_functions as tf
+    import pandas as pd
+    from matplotlib.colors import to_hex
+    
+    df = pd.DataFrame({
+        "x": points[:, 0],
+        "y": points[:, 1],
+        "cable_id": pd.Categorical(cable_ids),
+    })
+    x_range = (df["x"].min(), df["x"].max())
+    y_range = (df["y"].min(), df["y"].max())
+    
+    canvas = ds.Canvas(plot_width=1200, plot_height=1000, x_range=x_range, y_range=y_range)
+    agg = canvas.points(df, "x", "y", ds.count_cat("cable_id"))
+    categories = df["cable_id"].cat.categories
+    palette = sns.color_palette("bright", len(categories))
+    # Every occupied pixel is drawn opaque; by default lone points would be
+    # shaded almost transparent
+    image = tf.shade(
+        agg, color_key=dict(zip(categories, map(to_hex, palette))), min_alpha=255
+    )
+    
+    ax.imshow(
+        tf.spread(image, px=2).to_pil(),
+        extent=(*x_range, *y_range),
+        aspect="auto",
+    )
 
 
 def create_tsne_plot(
-    df: pd.DataFrame,
+    embeddings: QuantizedEmbeddings,
     output_path: Optional[str] = None,
     perplexity: int = 30,
     n_iter: int = 1000,
     random_state: int = 42,
     figsize: Tuple[int, int] = (12, 10),
     title: str = "t-SNE Visualization of Cable Embeddings",
+    reduce_dims: bool = True,
+    show_legend: Optional[bool] = None,
 ) -> None:
     """
     Create a t-SNE plot of embeddings colored by cable ID.
     
+    With DATASHADER_MIN_POINTS or more points, and datashader installed, the
+    points are rasterized instead of drawn one marker at a time, and no
+    legend is drawn. A legend entry per cable gets slow to draw, so by
+    default plots of more than MAX_LEGEND_ENTRIES cables have none either.
+    
     Args:
-        df: DataFrame containing embeddings
+        embeddings: Embeddings as returned by load_embeddings
         output_path: Path to save the plot (if None, display the plot)
         perplexity: Perplexity parameter for t-SNE
         n_iter: Number of iterations for t-SNE
         random_state: Random state for reproducibility
         figsize: Figure size (width, height) in inches
         title: Plot title
+        reduce_dims: Whether to reduce the embeddings with PCA before t-SNE
+        show_legend: Whether to draw a legend of cable IDs (default: only
+                     if there are at most MAX_LEGEND_ENTRIES of them)
     """
-    # Extract embeddings and cable IDs
-    embeddings = np.array(df['embedding'].tolist())
-    cable_ids = np.array(df['cable_id'].tolist())
+    # Extract cable IDs
+    cable_ids = embeddings.cable_ids
     
     # Apply t-SNE for dimensionality reduction
-    console.print("Applying t-SNE dimensionality reduction...", style="bold blue")
-    tsne = TSNE(
-        n_components=2,
+    tsne_result = run_tsne(
+        embeddings,
         perplexity=perplexity,
         n_iter=n_iter,
-        random_state=random_state
-    )
-    tsne_result = tsne.fit_transform(embeddings)
-    
-    # Create a plot
-    plt.figure(figsize=figsize)
-    ax = sns.scatterplot(
-        x=tsne_result[:, 0],
-        y=tsne_result[:, 1],
-        hue=cable_ids,
-        palette="bright",
-        s=100,
-        alpha=0.7
-    )
-    
-    # Add title and labels
-    plt.title(title, fontsize=16)
-    plt.xlabel("t-SNE Dimension 1", fontsize=12)
-    plt.ylabel("t-SNE Dimension 2", fontsize=12)
-    
-    # Move legend outside the plot
-    sns.move_legend(
-        ax, "upper left",
-        bbox_to_anchor=(1, 1),
-        title="Cable IDs",
-        frameon=True
+        random_state=random_state,
+        reduce_dims=reduce_dims
     )
     
-    # Adjust layout to make room for the legend
-    plt.tight_layout()
-    
-    # Save or display the plot
-    if output_path:
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        plt.savefig(output_path, dpi=300, bbox_inches="tight")
-        console.print(f"Plot saved to {output_path}", style="bold green")
-    else:
-        plt.show()
-        console.print("Plot displayed", style="bold green")
+    # Create a plot, closing it afterwards so a long-running daemon doesn't
+    # accumulate figures
+    fig = plt.figure(figsize=figsize)
+    try:
+        rasterize = (
+            len(tsne_result) >= DATASHADER_MIN_POINTS
+            and importlib.util.find_spec("datashader") is not None
+        )
+        if show_legend is None:
+            show_legend = len(np.unique(cable_ids)) <= MAX_LEGEND_ENTRIES
+        show_legend = show_legend and not rasterize
+        if rasterize:
+            ax = plt.gca()
+            _draw_rasterized(ax, tsne_result, cable_ids)
+        else:
+            ax = sns.scatterplot(
+                x=tsne_result[:, 0],
+                y=tsne_result[:, 1],
+                hue=cable_ids,
+                palette="bright",
+                s=100,
+                alpha=0.7,
+                legend="auto" if show_legend else False
+            )
+        
+        # Add title and labels
+        plt.title(title, fontsize=16)
+        plt.xlabel("t-SNE Dimension 1", fontsize=12)
+        plt.ylabel("t-SNE Dimension 2", fontsize=12)
+        
+        # Move legend outside the plot
+        if show_legend:
+            sns.move_legend(
+                ax, "upper left",
+                bbox_to_anchor=(1, 1),
+                title="Cable IDs",
+                frameon=True
+            )
+        
+        # Adjust layout to make room for the legend
+        plt.tight_layout()
+        
+        # Save or display the plot
+        if output_path:
+            if os.path.dirname(output_path):
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            plt.savefig(output_path, dpi=300, bbox_inches="tight")
+            console.print(f"Plot saved to {output_path}", style="bold green")
+        else:
+            plt.show()
+            console.print("Plot displayed", style="bold green")
+    finally:
+        plt.close(fig)